@@ -0,0 +1,31 @@
+# Times filling a chunk's worth of noise with the scalar squirrel3 in noise_random.py and with the numpy one
+# (tests/test_noise_random.py checks they give exactly the same numbers)
+# run from the repository root: python bench/bench_noise.py [repeats]
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath('src'))
+
+from constants import *
+from noise_random import *
+
+def run(repeats):
+    size = TM_CHUNK_SIZE
+    start_time = time.perf_counter()
+    for r in range(repeats):
+        _ = [[get_2d_seeded_noise(x, y, r) for y in range(size)] for x in range(size)]
+    scalar_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for r in range(repeats):
+        _ = noise_grid_2d(0, 0, size, size, r)
+    batch_time = time.perf_counter() - start_time
+
+    print("scalar: " + str(round(scalar_time / repeats * 1000, 4)) + "ms per chunk")
+    print("batch:  " + str(round(batch_time / repeats * 1000, 4)) + "ms per chunk")
+    print("speedup: " + str(round(scalar_time / max(batch_time, 1e-9), 2)) + "x")
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    run(repeats)
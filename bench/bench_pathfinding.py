@@ -0,0 +1,189 @@
+# Micro-benchmark for the A* in pathfinding.py against the one GameWorld.pathfind used to run
+# run from the repository root: python bench/bench_pathfinding.py [floors] [searches per floor]
+import os
+import sys
+import time
+import math
+import heapq
+import random
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.append(os.path.abspath('src'))
+
+import pygame
+
+from constants import *
+
+# The old A*, kept as it was apart from taking the map as pf_map (pathfinding_window().tolist())
+# instead of reading it itself, so converting the map isn't counted against every search
+def legacy_find_path(world, pf_map, start_x, start_y, dest_x, dest_y, strength=0, abs_path=False):
+    start = (start_x + world.pf_offset_x, start_y + world.pf_offset_y)
+
+    def outside_check(coord):
+        x, y = coord
+        return min(x, y) < 0 or x > PATHFINDING_WIDTH - 1 or y > PATHFINDING_HEIGHT - 1
+
+    if outside_check(start):
+        print("Tried to pathfind from outside pathfinding space")
+        print((start_x, start_y), start)
+        return []
+
+
+    dest_x, dest_y = (dest_x + world.pf_offset_x, dest_y + world.pf_offset_y)
+    dest = (dest_x, dest_y)
+
+    def heuristic(coord):
+        x, y = coord
+        return math.sqrt(pow(x - dest_x, 2) + pow(y - dest_y, 2))
+
+    adjacent_deltas = []
+    for dx in [-1, 0, 1]:
+        for dy in [-1, 0, 1]:
+            if dx == 0 and dy == 0:
+                continue
+            adjacent_deltas.append((dx, dy))
+
+    def delta_add(delta, coord):
+        return (delta[0] + coord[0], delta[1] + coord[1])
+
+    def is_diagonal(delta):
+        return delta[0] != 0 and delta[1] != 0
+
+    def straights(delta):
+        return [(delta[0], 0), (0, delta[1])]
+
+    path_found = False
+
+    delta_from = {start: None}
+    position_from = {start: None}
+    node_cost = {start: 0}
+    # priority que items go in the list as: (priority, (x, y))
+    frontier = [(0, start)]
+    while len(frontier) > 0:
+        _, cur = heapq.heappop(frontier)
+
+        if cur == dest:
+            path_found = True
+            break
+
+        # Always cost 1 to move for now
+        old_cost = node_cost[cur]
+        next_cost = old_cost + 1
+        for delta in adjacent_deltas:
+            adj = delta_add(delta, cur)
+            if outside_check(adj):
+                continue
+            val = pf_map[adj[0]][adj[1]]
+            # If the node is the destination, ignore strength (attack player)
+            if val > strength and adj != dest:
+                continue
+            # I'm doing diagonal movement for nice pathing but it needs to be a valid path orthoganally too
+            if is_diagonal(delta):
+                available_straights = 2
+                for s_delta in straights(delta):
+                    s_val = pf_map[cur[0] + s_delta[0]][cur[1] + s_delta[1]]
+                    if s_val > strength:
+                        available_straights -= 1
+                if available_straights < 1:
+                    continue
+
+
+            if adj in node_cost and node_cost[adj] <= next_cost:
+                continue
+            node_cost[adj] = next_cost
+            priority = next_cost + heuristic(adj)
+            heapq.heappush(frontier, (priority, adj))
+            delta_from[adj] = delta
+            position_from[adj] = cur
+
+    if not path_found:
+        #print("Could not find path, " + str(len(node_cost)) + " nodes checked")
+        return False
+
+    def to_world(coord):
+        lx, ly = coord
+        return (lx - world.pf_offset_x, ly - world.pf_offset_y)
+
+    path = []
+    cur_node = dest
+    while cur_node != start:
+        if abs_path:
+            path.append(to_world(cur_node))
+        else:
+            path.append(delta_from[cur_node])
+        cur_node = position_from[cur_node]
+
+    path.reverse()
+    return path
+
+
+def open_cells(world):
+    window = world.pathfinding_window()
+    cells = []
+    for pf_x in range(PATHFINDING_WIDTH):
+        for pf_y in range(PATHFINDING_HEIGHT):
+            if window[pf_x, pf_y] == 0:
+                cells.append((pf_x - world.pf_offset_x, pf_y - world.pf_offset_y))
+    return cells
+
+def run(floors, searches):
+    pygame.init()
+    pygame.display.set_mode(get_internal_res())
+
+    # Debug mode generates every chunk up front with everything revealed
+    GameSettings.debug_mode = True
+    from world import GameWorld
+
+    legacy_time = 0
+    new_time = 0
+    found = 0
+    mismatches = 0
+    # The old euclidean heuristic overestimates diagonal distance so it sometimes settles for a longer path
+    shorter = 0
+    for floor in range(floors):
+        # Same floors every run
+        GameSettings.floor_seed = floor
+        world = GameWorld(pygame.time.Clock())
+        world.update_whole_pathfinding_map()
+        cells = open_cells(world)
+        if len(cells) < 2:
+            continue
+
+        # Both get their map ready once per floor outside the timing, like the game would between map changes
+        pf_map = world.pathfinding_window().tolist()
+        world.padded_pathfinding_grid()
+
+        rng = random.Random(floor)
+        for i in range(searches):
+            (sx, sy), (dx, dy) = rng.sample(cells, 2)
+            # strength 6 walks through closed doors so plenty of the searches cross whole chunks
+            strength = rng.choice([0, 6])
+
+            start_time = time.perf_counter()
+            legacy = legacy_find_path(world, pf_map, sx, sy, dx, dy, strength)
+            legacy_time += time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            new = world.pathfind(sx, sy, dx, dy, strength)
+            new_time += time.perf_counter() - start_time
+
+            if bool(legacy) != bool(new) or (legacy and len(legacy) < len(new)):
+                mismatches += 1
+            elif legacy and len(legacy) > len(new):
+                shorter += 1
+            if new:
+                found += 1
+
+    total = floors * searches
+    print("searches: " + str(total) + ", paths found: " + str(found))
+    print("new path longer or missing: " + str(mismatches) + ", new path shorter: " + str(shorter))
+    print("legacy A*: " + str(round(legacy_time / total * 1000, 4)) + "ms per search")
+    print("new A*:    " + str(round(new_time / total * 1000, 4)) + "ms per search")
+    print("speedup:   " + str(round(legacy_time / max(new_time, 1e-9), 2)) + "x")
+
+    pygame.quit()
+
+if __name__ == "__main__":
+    floors = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    searches = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    run(floors, searches)
@@ -1,6 +1,10 @@
 
 TM_CHUNK_SIZE = 26
 
+# Tile kinds
+TILE_NONE = 0
+TILE_FLOOR = 1
+
 GRID_WIDTH = 18
 
 PATHFINDING_WIDTH = 80
@@ -8,6 +12,12 @@ PATHFINDING_HEIGHT = 80
 
 PATHFINDING_CENTER_DEADZONE = 20
 
+# A* gives up after expanding this many nodes
+PATHFINDING_MAX_EXPANSIONS = 2400
+
+# Size in pixels of the cells OffsetGroup sorts sprites into for culling, has to be bigger than any sprite
+SPRITE_GRID_SIZE = 64
+
 
 class GameSettings:
     game_scale = 1
@@ -15,6 +25,24 @@ class GameSettings:
     enable_fps = False
     debug_mode = False
 
+    # Double check GameWorld.what_is_at results against a scan of every entity (slow)
+    check_entity_index = False
+
+    # Seed to generate every floor from, None for a different floor each time
+    floor_seed = None
+    # Save whole floors in cache/floors by seed and load them from there instead of generating them again
+    # only used when floor_seed is set
+    floor_cache = False
+
+    # Milliseconds per frame the reveal flood fill is allowed to use
+    reveal_frame_budget = 4
+
+    # Only scale and send the parts of the screen that changed to the display
+    dirty_rect_rendering = True
+
+    # When nothing is happening the game loop sleeps until an event comes in, for at most this many milliseconds
+    idle_wait_timeout = 500
+
     internal_w = 270
     internal_h = 200
 
@@ -0,0 +1,106 @@
+import heapq
+
+# Effect strings from items.yaml ('damage +2', 'damage_type hack', 'linger 16 damage +1') are parsed once into these
+class Effect:
+    __slots__ = ('name', 'properties', 'amount', 'linger', 'inner')
+
+    def __init__(self, name, properties):
+        self.name = name
+        self.properties = properties
+        # Numeric effects ('damage +2') add up, anything else ('damage_type hack') is just a value
+        try:
+            self.amount = int(properties)
+        except ValueError:
+            self.amount = None
+
+        # 'linger <turns> <effect>' wraps another effect that lasts a number of turns
+        self.linger = None
+        self.inner = None
+        if name == 'linger':
+            linger_val, inner = properties.split(' ', 1)
+            self.linger = int(linger_val)
+            self.inner = compile_effect(inner)
+
+s_compiled_effects = {}
+
+def compile_effect(effect):
+    if effect not in s_compiled_effects:
+        effect_name, effect_properties = effect.split(' ', 1)
+        s_compiled_effects[effect] = Effect(effect_name, effect_properties)
+    return s_compiled_effects[effect]
+
+# The ongoing effects on one entity
+# Numeric effects are kept as running totals per name and other values as counts, both updated as effects
+# come and go, so looking up a stat doesn't go through every effect
+# Timed effects go in a heap by the turn they run out on
+class EffectSet:
+    def __init__(self):
+        # (source, Effect) for every effect currently on
+        self.ongoing = []
+        self.totals = {}
+        self.values = {}
+        self.value_lists = {}
+
+        self.turn = 0
+        self.expiring = []
+        self.next_id = 0
+
+    def add(self, source, effect, linger=-1):
+        entry = (source, effect, self.next_id)
+        self.next_id += 1
+        self.ongoing.append(entry)
+        self.apply(effect, 1)
+        # negative linger values mean linger indefinitely
+        if linger > -1:
+            heapq.heappush(self.expiring, (self.turn + linger, entry[2], entry))
+
+    def remove(self, entry):
+        self.ongoing.remove(entry)
+        self.apply(entry[1], -1)
+
+    def remove_source(self, source):
+        keep = []
+        for entry in self.ongoing:
+            if entry[0] == source:
+                self.apply(entry[1], -1)
+            else:
+                keep.append(entry)
+        self.ongoing = keep
+
+        kept_ids = {entry[2] for entry in self.ongoing}
+        self.expiring = [item for item in self.expiring if item[1] in kept_ids]
+        heapq.heapify(self.expiring)
+
+    def apply(self, effect, direction):
+        name = effect.name
+        if effect.amount is not None:
+            self.totals[name] = self.totals.get(name, 0) + effect.amount * direction
+            return
+
+        counts = self.values.setdefault(name, {})
+        count = counts.get(effect.properties, 0) + direction
+        if count > 0:
+            counts[effect.properties] = count
+        else:
+            counts.pop(effect.properties, None)
+        self.value_lists.pop(name, None)
+
+    # A turn went by, anything that ran out is removed
+    def tick(self):
+        self.turn += 1
+        expiring = self.expiring
+        while expiring and expiring[0][0] <= self.turn:
+            _, _, entry = heapq.heappop(expiring)
+            self.remove(entry)
+
+    def total(self, name):
+        return self.totals.get(name, 0)
+
+    # Every value of the non-numeric effects with this name, one for each effect
+    def value_list(self, name):
+        if name not in self.value_lists:
+            value_list = []
+            for value, count in self.values.get(name, {}).items():
+                value_list.extend([value] * count)
+            self.value_lists[name] = value_list
+        return self.value_lists[name]
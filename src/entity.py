@@ -1,4 +1,3 @@
-import pygame
 import math
 
 import os
@@ -8,8 +7,10 @@ import yaml
 import random
 
 from constants import *
-from sprite import BasicSprite
+from sprite import BasicSprite, load_png_image
 from inventory import Inventory, get_item_data
+from entity_store import *
+from effects import EffectSet, compile_effect
 
 # Keep static data loaded from yaml files
 with open('data/loot_sets.yaml') as loot_sets_data:
@@ -37,15 +38,61 @@ def random_loot_from_set(loot_set_name, quantity):
     return random.choices(loot_set, weights=weights, k=quantity)
 
 class Entity(BasicSprite):
+    # Fields TurnScheduler batches live in the world's EntityStore at self.slot, everything else is a normal attribute
+    grid_x = StoreField('grid_x')
+    grid_y = StoreField('grid_y')
+    sleep_distance = StoreField('sleep_distance')
+
     bump_constant = 5
     bump_progress_multiplier = 2.0
 
     SCREEN_SLEEP_DISTANCE = 18
 
+    # Defaults, each creature type gets a subclass (see compile_creature_class) that overrides these from creatures.yaml
+    img_name = 'no_img'
+    base_attack = 1
+    has_inventory = False
+    loot = ()
+    move_wait = 0
+    can_diagonal = False
+    friendly_fire = False
+    movement_pattern = 'naive'
+    move_handler = None
+    idle_move_handler = None
+    max_hp = 1
+    prefer_horizontal = True
+    prefer_horizontal_ = True
+    # Should be facing right when unflipped
+    img_flipped = False
+    anim_bounce = False
+    non_move_animation = False
+    # EffectSet, made when the first ongoing effect is added
+    effects = None
+    hp = 1
+    living = True
+    hidden = True
+    active = False
+    moves = False
+    animates = False
+    agro = True
+    agro_when_hit = False
+    no_wait_on_hit = False
+    wait_counter = 0
+    random_wait = 0
+    # (store column, starting value) pairs, written straight into the store
+    store_defaults = ()
+
+    # Creatures are made as their creature type's subclass
+    def __new__(cls, world, x, y, visible=True, ent_type='creature', subtype='goon'):
+        if cls is Entity and ent_type == 'creature':
+            cls = creature_class(subtype)
+        return super().__new__(cls)
+
     def __init__(self, world, x, y, visible=True, ent_type='creature', subtype='goon'):
+        self.store = world.entity_store
+        self.slot = self.store.allocate()
 
         # Figure out which image to use
-        self.img_name = 'no_img'
         if ent_type == 'bustable':
             self.img_name = subtype
         if ent_type == 'pickup':
@@ -56,13 +103,8 @@ class Entity(BasicSprite):
         elif ent_type == 'door':
             self.img_name = 'door'
         elif ent_type == 'creature':
-            if subtype not in s_creature_specs:
-                print("Creature of subtype " + str(subtype) + " not found")
-                subtype = 'goon'
-            creature_spec = s_creature_specs[subtype]
-            #if GameSettings.debug_mode:
-                #print(creature_spec)
-            self.img_name = creature_spec['image'] if 'image' in creature_spec else 'no_img'
+            # Might have been swapped for a default if the subtype doesn't exist
+            subtype = self.subtype
 
         # Figure out which layer to use
         layer = 4
@@ -71,7 +113,8 @@ class Entity(BasicSprite):
 
         # Create Sprite
         super().__init__(self.img_name, visible, layer)
-        self.subtype = subtype
+        if ent_type != 'creature':
+            self.subtype = subtype
 
         # Set position on grid
         self.world = world
@@ -79,19 +122,10 @@ class Entity(BasicSprite):
 
         self.entity_type = ent_type
 
-        # Default attributes, can be overriden by creature spec
-        self.living = True
-        self.hidden = True
-        self.hp = 1
-        self.base_attack = 1
-        self.has_inventory = False
-
-        self.moves = False
-        self.animates = False
-        self.loot = []
-        self.ongoing_effects = []
-
-        self.agro = True
+        # Default attributes, creature types have all of theirs worked out already
+        columns = self.store.columns
+        for column, value in self.store_defaults:
+            columns[column][self.slot] = value
 
         # Special defaults
         if ent_type == 'bustable':
@@ -99,53 +133,35 @@ class Entity(BasicSprite):
                 self.loot = [{'set': 'chest', 'quantity': 1}]
             else:
                 self.loot = [{'set': 'pot', 'quantity': 1}]
-        elif ent_type == 'creature':
-            self.moves = True
-            self.animates = True
         elif ent_type == 'door':
             self.closed = True
 
-        if self.moves:
-            self.move_wait = 0
-            self.can_diagonal = False
-            self.friendly_fire = False
-            self.movement_pattern = "naive"
-
-        if ent_type == 'creature':
-            if 'loot' in creature_spec:
-                self.loot = creature_spec['loot']
-            if 'attributes' in creature_spec:
-                for attr, val in creature_spec['attributes'].items():
-                    setattr(self, attr, val)
-
-        # Automatic attributes
-        self.max_hp = self.hp
         if self.moves:
             self.just_moved = False
-            self.active = not self.hidden
-            self.wait_counter = self.move_wait
-            self.prefer_horizontal = True
-            self.prefer_horizontal_ = True
-
-            if hasattr(self, 'agro_when_hit'):
-                self.agro = False
 
         if self.animates:
-            # Should be facing right when unflipped
-            self.img_flipped = False
-
             px, py = self.get_pos()
             self.origin_pos_x = px
             self.origin_pos_y = py
             self.target_pos_x = px
             self.target_pos_y = py
 
-            self.anim_bounce = False
-            self.non_move_animation = False
-
         if self.has_inventory:
             self.inventory = Inventory(self)
 
+    # Only entities in the world's entity group take turns
+    def add_internal(self, group):
+        super().add_internal(group)
+        if group is self.world.entity_group:
+            self.store.attach(self)
+            self.world.scheduler.attach(self)
+
+    def remove_internal(self, group):
+        super().remove_internal(group)
+        if group is self.world.entity_group:
+            self.store.detach(self)
+            self.world.scheduler.detach(self)
+
     def get_grid_x_y(self):
         return self.grid_x, self.grid_y
 
@@ -155,6 +171,7 @@ class Entity(BasicSprite):
     def set_grid_position(self, x, y, instant_move=True):
         self.grid_x = x
         self.grid_y = y
+        self.world.entity_placed(self)
         if instant_move or not self.animates:
             self.set_pos(x * GRID_WIDTH, y * GRID_WIDTH)
         else:
@@ -162,22 +179,8 @@ class Entity(BasicSprite):
         self.just_moved = True
 
     def post_turn(self):
-        if len(self.ongoing_effects):
-            cull = []
-            for index in range(len(self.ongoing_effects)):
-                effect = self.ongoing_effects[index]
-                if 'countdown' in effect:
-                    self.ongoing_effects[index]['countdown'] = effect['countdown'] - 1
-                    if self.ongoing_effects[index]['countdown'] < 1:
-                        cull.append(index)
-
-            filtered = []
-            for index in range(len(self.ongoing_effects)):
-                if index not in cull:
-                    filtered.append(self.ongoing_effects[index])
-
-            self.ongoing_effects = filtered
-            
+        if self.effects is not None:
+            self.effects.tick()
 
 
     ##############################
@@ -195,43 +198,33 @@ class Entity(BasicSprite):
         if not self.has_inventory:
             return
 
-        filtered = []
-        for effect in self.ongoing_effects:
-            if effect['source'] == 'equipment':
-                continue
-            filtered.append(effect)
-        self.ongoing_effects = filtered
+        if self.effects is not None:
+            self.effects.remove_source('equipment')
 
         self.equipped = self.inventory.get_all_equipped()
         for item in self.equipped:
             d = get_item_data(item.item_type)
             if 'effects' in d:
                 for effect in d['effects']:
-                    effect_name, effect_properties = effect.split(' ', 1)
-                    self.ongoing_effects.append({'source': 'equipment', 'name': effect_name, 'properties': effect_properties})
+                    self.ongoing_effect('equipment', effect)
     # Inventory, Items
     ##############################
 
     ##############################
     # Combat, AI, Visibility etc
     def get_attack(self):
-        bonus_damage = 0
-        damage_types = []
-        for effect in self.ongoing_effects:
-            if effect['name'] == 'damage':
-                bonus_damage += int(effect['properties'])
-            elif effect['name'] == 'damage_type':
-                damage_types.append(effect['properties'])
-        return {'amount': self.base_attack + bonus_damage, 'damage_types': damage_types}
+        if self.effects is None:
+            return {'amount': self.base_attack, 'damage_types': []}
+        return {'amount': self.base_attack + self.effects.total('damage'), 'damage_types': self.effects.value_list('damage_type')}
 
     def take_damage(self, damage):
         self.hp -= damage['amount']
 
         # Immediately counterattack if still waiting to move
-        if hasattr(self, 'wait_counter') and hasattr(self, 'no_wait_on_hit'):
-            self.wait_counter = 0
+        if self.no_wait_on_hit:
+            self.world.scheduler.interrupt(self)
 
-        if hasattr(self, 'agro_when_hit') and not self.agro:
+        if self.agro_when_hit and not self.agro:
             self.agro = True
 
         if self.hp <= 0:
@@ -242,24 +235,24 @@ class Entity(BasicSprite):
             self.world.do_camera_shake(0.2)
 
     def instant_effect(self, effect):
-        effect_name, effect_properties = effect.split(' ', 1)
-        if effect_name == "health":
-            amount = int(effect_properties)
-            if amount < 0:
-                self.take_damage({'amount': amount})
+        effect = compile_effect(effect)
+        if effect.name == "health":
+            if effect.amount < 0:
+                self.take_damage({'amount': effect.amount})
             else:
-                self.heal(amount)
-        elif effect_name == "linger":
-            linger_val, ongoing_effect = effect_properties.split(' ', 1)
-            self.ongoing_effect('linger', ongoing_effect, int(linger_val))
+                self.heal(effect.amount)
+        elif effect.name == "linger":
+            self.ongoing_effect('linger', effect.inner, effect.linger)
 
+    # effect can be an effect string or an already compiled Effect
     # negative linger values mean linger indefinitely
     def ongoing_effect(self, source, effect, linger=-1):
-        effect_name, effect_properties = effect.split(' ', 1)
-        effect_dict = {'source': source, 'name': effect_name, 'properties': effect_properties}
-        if linger > -1:
-            effect_dict['countdown'] = linger
-        self.ongoing_effects.append(effect_dict)
+        if isinstance(effect, str):
+            effect = compile_effect(effect)
+        if self.effects is None:
+            self.effects = EffectSet()
+            self.world.scheduler.track_effects(self)
+        self.effects.add(source, effect, linger)
 
     def heal(self, amount):
         self.hp = min(self.max_hp, self.hp + amount)
@@ -272,6 +265,11 @@ class Entity(BasicSprite):
         self.visible = True
         if self.moves:
             self.active = True
+            self.world.scheduler.revealed(self)
+
+    def kill(self):
+        self.world.entity_removed(self)
+        super().kill()
 
     def die(self, enable_drops=True):
         self.kill() # Removes sprite from all groups, if that was the only reference to the entity it will be garbage collected
@@ -297,46 +295,21 @@ class Entity(BasicSprite):
         if self.moves:
             self.active = True
 
-    def do_a_thing(self):
-        if not self.moves or not self.living:
-            return
-
-        # Sleep if too far offscreen
-        # Wake if sleeping and close to onscreen
-        if not self.active:
-            if not self.far_offscreen():
-                self.wake()
-            else:
-                return
-        elif self.far_offscreen():
-            self.sleep()
-            return
-
+    # Take this entity's turn, TurnScheduler only calls this when it's awake and due to act
+    def act(self):
         if self.entity_type == 'creature':
-            if self.wait_counter > 0:
-                self.wait_counter -= 1
-                return
-            if hasattr(self, 'random_wait'):
+            if self.random_wait:
                 do_wait = random.randint(1, self.random_wait) == 1
                 if do_wait:
                     return
 
-            move_pattern = self.movement_pattern
-            if not self.agro and hasattr(self, 'idle_movement_pattern'):
-                move_pattern = self.idle_movement_pattern
-
-            if move_pattern == 'chase':
-                deltas = self.pathfind_follow_player()
-            elif move_pattern == 'naive':
-                deltas = self.simple_follow_player()
-            elif move_pattern == 'random':
-                deltas = self.get_random_move()
-            elif move_pattern == 'diagonal_naive':
-                deltas = self.simple_follow_player(True)
-            else:
-                print("Bad movement pattern: " + str(move_pattern))
+            move_handler = self.move_handler
+            if not self.agro and self.idle_move_handler:
+                move_handler = self.idle_move_handler
+            if not move_handler:
                 return
 
+            deltas = move_handler()
             if not deltas:
                 return
             delta_x, delta_y = deltas
@@ -367,12 +340,17 @@ class Entity(BasicSprite):
         return random.choice(open_moves)
 
     def pathfind_follow_player(self):
-        player_x, player_y = self.world.get_player().get_grid_x_y()
-        path = self.world.pathfind(self.grid_x, self.grid_y, player_x, player_y)
-        if not path:
+        if self.world.in_pathfinding_window(self.grid_x, self.grid_y):
+            step = self.world.flow_step_toward_player(self.grid_x, self.grid_y)
+        else:
+            # Too far away for the pathfinding window, go the long way through the chunk doors
+            player_x, player_y = self.world.get_player().get_grid_x_y()
+            path = self.world.long_range_pathfind(self.grid_x, self.grid_y, player_x, player_y)
+            step = path[0] if path else False
+        if not step:
             return False
         # Follow the first delta move in the path
-        x_delta, y_delta = path[0]
+        x_delta, y_delta = step
 
         # orthogal move or we can move diagonally
         if self.can_diagonal or x_delta == 0 or y_delta == 0:
@@ -417,12 +395,15 @@ class Entity(BasicSprite):
             else:
                 return (0 if x_diff == 0 else int(math.copysign(1, x_diff)), 0 if y_diff == 0 else int(math.copysign(1, y_diff)))
 
+    def diagonal_follow_player(self):
+        return self.simple_follow_player(True)
+
     def far_offscreen(self):
         player_x, player_y = self.world.get_player().get_grid_x_y()
         x_diff = abs(player_x - self.grid_x)
         y_diff = abs(player_y - self.grid_y)
 
-        return max(x_diff, y_diff) > Entity.SCREEN_SLEEP_DISTANCE
+        return max(x_diff, y_diff) > self.sleep_distance
     # Combat, AI, Visibility etc
     #################################
 
@@ -436,7 +417,7 @@ class Entity(BasicSprite):
 
     def change_look(self, left=True):
         if self.img_flipped != left:
-            self.image = pygame.transform.flip(self.image, True, False)
+            self.image, _ = load_png_image(self.img_name, left)
         self.img_flipped = left
 
     def animate_to(self, x, y, bounce):
@@ -481,3 +462,58 @@ class Entity(BasicSprite):
     # Animation functions
     ##################################3
 
+# movement_pattern in creatures.yaml -> Entity method that picks the move
+MOVEMENT_HANDLERS = {
+    'chase': Entity.pathfind_follow_player,
+    'naive': Entity.simple_follow_player,
+    'random': Entity.get_random_move,
+    'diagonal_naive': Entity.diagonal_follow_player,
+}
+
+def movement_handler(subtype, move_pattern):
+    if move_pattern not in MOVEMENT_HANDLERS:
+        print("Bad movement pattern for " + str(subtype) + ": " + str(move_pattern))
+        return None
+    return MOVEMENT_HANDLERS[move_pattern]
+
+# Turn a creature spec into an Entity subclass with everything from the spec already worked out
+def compile_creature_class(subtype, creature_spec):
+    class_attrs = {
+        'subtype': subtype,
+        'img_name': creature_spec['image'] if 'image' in creature_spec else 'no_img',
+        'loot': creature_spec['loot'] if 'loot' in creature_spec else (),
+        'hp': 1,
+        'living': True,
+        'hidden': True,
+        'agro': True,
+        'moves': True,
+        'animates': True,
+        'sleep_distance': Entity.SCREEN_SLEEP_DISTANCE,
+    }
+    class_attrs.update(creature_spec.get('attributes', {}))
+
+    # What Entity.__init__ used to work out for every new creature
+    class_attrs['max_hp'] = class_attrs['hp']
+    if class_attrs['moves']:
+        class_attrs['active'] = not class_attrs['hidden']
+        class_attrs['wait_counter'] = class_attrs.get('move_wait', Entity.move_wait)
+        if class_attrs.get('agro_when_hit'):
+            class_attrs['agro'] = False
+
+    # Store fields go in the store when the entity is made, a class attribute would hide the descriptor
+    class_attrs['store_defaults'] = tuple((column, class_attrs.pop(column)) for column in COLUMNS if column in class_attrs)
+
+    class_attrs['move_handler'] = movement_handler(subtype, class_attrs.get('movement_pattern', Entity.movement_pattern))
+    if 'idle_movement_pattern' in class_attrs:
+        class_attrs['idle_move_handler'] = movement_handler(subtype, class_attrs['idle_movement_pattern'])
+
+    class_name = ''.join(part.capitalize() for part in subtype.split('_'))
+    return type(class_name, (Entity,), class_attrs)
+
+s_creature_classes = {subtype: compile_creature_class(subtype, spec) for subtype, spec in s_creature_specs.items()}
+
+def creature_class(subtype):
+    if subtype not in s_creature_classes:
+        print("Creature of subtype " + str(subtype) + " not found")
+        subtype = 'goon'
+    return s_creature_classes[subtype]
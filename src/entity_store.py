@@ -0,0 +1,75 @@
+from array import array
+
+import numpy as np
+
+# The fields TurnScheduler looks at for every awake entity at once, kept in one typed array per field
+# instead of on each Entity so the check can be done with numpy (see too_far)
+# Entity looks these up through the StoreField descriptor below, so entity.grid_x etc. work like before
+# Everything else about an entity is a normal attribute, going through the store only pays off for batched fields
+#
+# Slots are handed out in the order entities are made and never reused, dead entities keep theirs
+# (something might still be holding onto them) and the whole store goes away with the GameWorld
+
+# field name -> (array typecode, numpy dtype)
+COLUMNS = {
+    'grid_x': ('i', np.int32),
+    'grid_y': ('i', np.int32),
+    'sleep_distance': ('i', np.int32),
+}
+
+class EntityStore:
+    # Columns grow by this many slots at a time
+    GROW_BY = 256
+
+    def __init__(self):
+        self.columns = {}
+        for name, (typecode, _) in COLUMNS.items():
+            self.columns[name] = array(typecode)
+        self.count = 0
+        self.capacity = 0
+
+        # slot -> Entity, only while it's in the world's entity group
+        self.entities = []
+
+    def allocate(self):
+        if self.count == self.capacity:
+            for column in self.columns.values():
+                column.extend([0] * EntityStore.GROW_BY)
+            self.capacity += EntityStore.GROW_BY
+        self.entities.append(None)
+        self.count += 1
+        return self.count - 1
+
+    def attach(self, entity):
+        self.entities[entity.slot] = entity
+
+    def detach(self, entity):
+        self.entities[entity.slot] = None
+
+    # Copy of a column's values at some slots as a numpy array
+    # Never hand out a view, an array can't grow (BufferError) while anything is looking at its buffer
+    def gather(self, name, slots):
+        return np.frombuffer(self.columns[name], dtype=COLUMNS[name][1])[slots]
+
+    # Which of these slots are further from a position than their sleep distance, in the order they were given
+    def too_far(self, slots, x, y):
+        if len(slots) == 0:
+            return []
+        slots = np.array(slots, dtype=np.intp)
+        distance = np.maximum(np.abs(self.gather('grid_x', slots) - x), np.abs(self.gather('grid_y', slots) - y))
+        return slots[distance > self.gather('sleep_distance', slots)].tolist()
+
+# An Entity attribute that lives in one of the store's columns
+class StoreField:
+    __slots__ = ('column',)
+
+    def __init__(self, column):
+        self.column = column
+
+    def __get__(self, entity, owner=None):
+        if entity is None:
+            return self
+        return entity.store.columns[self.column][entity.slot]
+
+    def __set__(self, entity, value):
+        entity.store.columns[self.column][entity.slot] = value
@@ -0,0 +1,217 @@
+from constants import *
+
+import os
+import json
+import struct
+
+import numpy as np
+
+from generation import ChunkGrid, generate_floor, generate_chunk, GENERATOR_VERSION
+
+# Finished floors saved to disk by seed, so the same floor can be played (or benchmarked) again without generating it
+#
+# File layout, everything little endian:
+#   magic (8 bytes), version (uint32), header length (uint32)
+#   header: utf-8 json with the floor_data that isn't per tile and the generator version, see write_floor
+#   padding up to a multiple of 8 bytes
+#   kinds:       uint8 [chunk count, TM_CHUNK_SIZE, TM_CHUNK_SIZE]
+#   variants:    uint8 [chunk count, TM_CHUNK_SIZE, TM_CHUNK_SIZE], index into that chunk's tile names
+#   place_order: int32 [chunk count, TM_CHUNK_SIZE, TM_CHUNK_SIZE]
+#   room_ids:    int16 [chunk count, TM_CHUNK_SIZE, TM_CHUNK_SIZE]
+#   spawns:      SPAWN_DTYPE [spawn count], in the order they get made, names index into the header's name table
+#   room tiles:  POSITION_DTYPE [total room tiles], every room's tiles one room after another
+#   room doors:  POSITION_DTYPE [total room doors], same for the doors
+# chunk n is the nth chunk in the header's chunk list, header 'room-sizes' has (tiles, doors) for each room of each chunk
+# Positions are in chunk coords
+
+FLOOR_CACHE_DIR = 'cache/floors'
+FLOOR_CACHE_MAGIC = b'MRFLOOR\0'
+FLOOR_CACHE_VERSION = 1
+
+SPAWN_DTYPE = np.dtype([('chunk', '<u2'), ('x', 'i1'), ('y', 'i1'), ('entity_type', '<u2'), ('subtype', '<u2')])
+POSITION_DTYPE = np.dtype([('x', 'i1'), ('y', 'i1')])
+
+def floor_cache_path(seed):
+    return os.path.join(FLOOR_CACHE_DIR, str(seed) + '.floor')
+
+# chunks is chunk_pos -> generated chunk (generation.generate_chunk) for every chunk on the floor
+def write_floor(path, floor_data, chunks):
+    chunk_list = sorted(floor_data['chunks'])
+    names = []
+    name_ids = {}
+
+    def name_id(name):
+        if name not in name_ids:
+            name_ids[name] = len(names)
+            names.append(name)
+        return name_ids[name]
+
+    shape = (len(chunk_list), TM_CHUNK_SIZE, TM_CHUNK_SIZE)
+    kinds = np.zeros(shape, dtype=np.uint8)
+    variants = np.zeros(shape, dtype=np.uint8)
+    place_order = np.zeros(shape, dtype='<i4')
+    room_ids = np.zeros(shape, dtype='<i2')
+    spawns = []
+    room_tiles = []
+    room_doors = []
+    room_sizes = []
+    tile_names = []
+    placed_counts = []
+    for n, chunk_pos in enumerate(chunk_list):
+        chunk = chunks[chunk_pos]
+        grid = chunk['grid']
+        kinds[n] = grid.kinds
+        variants[n] = grid.variants
+        place_order[n] = grid.place_order
+        room_ids[n] = grid.room_ids
+        tile_names.append(grid.tile_names)
+        placed_counts.append(grid.placed_count)
+        for spawn in chunk['spawns']:
+            x, y = spawn['position']
+            spawns.append((n, x, y, name_id(spawn['entity_type']), name_id(spawn['subtype'])))
+
+        world_x, world_y = chunk_pos[0] * TM_CHUNK_SIZE, chunk_pos[1] * TM_CHUNK_SIZE
+        sizes = []
+        for room in chunk['rooms']:
+            room_tiles.extend((x - world_x, y - world_y) for x, y in room['tiles'])
+            room_doors.extend((x - world_x, y - world_y) for x, y in room['doors'])
+            sizes.append([len(room['tiles']), len(room['doors'])])
+        room_sizes.append(sizes)
+    spawns = np.array(spawns, dtype=SPAWN_DTYPE)
+    room_tiles = np.array(room_tiles, dtype=POSITION_DTYPE)
+    room_doors = np.array(room_doors, dtype=POSITION_DTYPE)
+
+    chunk_properties = []
+    for chunk_pos in chunk_list:
+        properties = dict(floor_data['chunk-properties'][chunk_pos])
+        properties['position'] = list(chunk_pos)
+        chunk_properties.append(properties)
+
+    header = {
+        'seed': floor_data['seed'],
+        'generator-version': GENERATOR_VERSION,
+        'chunk-size': TM_CHUNK_SIZE,
+        'chunks': [list(chunk_pos) for chunk_pos in chunk_list],
+        'chunk-properties': chunk_properties,
+        'doors': [[x, y, side, position] for (x, y, side), position in sorted(floor_data['doors'].items())],
+        'starting-chunk': list(floor_data['starting-chunk']),
+        'spawn': list(floor_data['spawn']),
+        'tile-names': tile_names,
+        'placed-counts': placed_counts,
+        'names': names,
+        'spawn-count': len(spawns),
+        'room-sizes': room_sizes,
+        'room-tile-count': len(room_tiles),
+        'room-door-count': len(room_doors),
+    }
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+    padding = -(16 + len(header_bytes)) % 8
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written next to where it goes and then moved, so a half written file never gets loaded
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(FLOOR_CACHE_MAGIC)
+        f.write(struct.pack('<II', FLOOR_CACHE_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b'\0' * padding)
+        for array in (kinds, variants, place_order, room_ids, spawns, room_tiles, room_doors):
+            f.write(array.tobytes())
+    os.replace(temp_path, path)
+
+# Returns (floor_data, chunks) like write_floor got, raises ValueError if the file isn't a floor this version can use
+# With memmap the tile arrays are read straight out of the file as they're used, otherwise it's all read in at once
+def read_floor(path, memmap=False):
+    with open(path, 'rb') as f:
+        if f.read(8) != FLOOR_CACHE_MAGIC:
+            raise ValueError(path + ' is not a floor file')
+        version, header_length = struct.unpack('<II', f.read(8))
+        if version != FLOOR_CACHE_VERSION:
+            raise ValueError(path + ' is floor file version ' + str(version))
+        header = json.loads(f.read(header_length).decode())
+    if header.get('generator-version') != GENERATOR_VERSION:
+        raise ValueError(path + ' was made by a different version of generation.py')
+    if header['chunk-size'] != TM_CHUNK_SIZE:
+        raise ValueError(path + ' has a different chunk size')
+
+    chunk_list = [tuple(chunk_pos) for chunk_pos in header['chunks']]
+    shape = (len(chunk_list), TM_CHUNK_SIZE, TM_CHUNK_SIZE)
+    offset = 16 + header_length + (-(16 + header_length) % 8)
+
+    layout = [(np.dtype(np.uint8), shape), (np.dtype(np.uint8), shape), (np.dtype('<i4'), shape), (np.dtype('<i2'), shape),
+              (SPAWN_DTYPE, (header['spawn-count'],)),
+              (POSITION_DTYPE, (header['room-tile-count'],)), (POSITION_DTYPE, (header['room-door-count'],))]
+    arrays = []
+    for dtype, array_shape in layout:
+        if memmap and int(np.prod(array_shape)) > 0:
+            array = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=array_shape)
+        else:
+            array = np.fromfile(path, dtype=dtype, count=int(np.prod(array_shape)), offset=offset).reshape(array_shape)
+        arrays.append(array)
+        offset += array.nbytes
+    kinds, variants, place_order, room_ids, spawns, room_tiles, room_doors = arrays
+
+    chunk_properties = {}
+    for properties in header['chunk-properties']:
+        properties['position'] = tuple(properties['position'])
+        chunk_properties[properties['position']] = properties
+    floor_data = {
+        'seed': header['seed'],
+        'chunks': set(chunk_list),
+        'chunk-properties': chunk_properties,
+        'doors': {(x, y, side): position for x, y, side, position in header['doors']},
+        'starting-chunk': tuple(header['starting-chunk']),
+        'spawn': tuple(header['spawn']),
+    }
+
+    # Room positions go back to world coords all at once
+    room_tiles_x, room_tiles_y = room_tiles['x'].astype(np.int64), room_tiles['y'].astype(np.int64)
+    room_doors_x, room_doors_y = room_doors['x'].astype(np.int64), room_doors['y'].astype(np.int64)
+
+    names = header['names']
+    chunks = {}
+    tile_start = 0
+    door_start = 0
+    for n, chunk_pos in enumerate(chunk_list):
+        grid = ChunkGrid()
+        grid.kinds = kinds[n]
+        grid.variants = variants[n]
+        grid.place_order = place_order[n]
+        grid.room_ids = room_ids[n]
+        grid.placed_count = header['placed-counts'][n]
+        for tile_img in header['tile-names'][n]:
+            grid.tile_name_id(tile_img)
+
+        world_x, world_y = chunk_pos[0] * TM_CHUNK_SIZE, chunk_pos[1] * TM_CHUNK_SIZE
+        rooms = []
+        for tile_count, door_count in header['room-sizes'][n]:
+            tile_stop = tile_start + tile_count
+            door_stop = door_start + door_count
+            rooms.append({
+                'tiles': list(zip((room_tiles_x[tile_start:tile_stop] + world_x).tolist(), (room_tiles_y[tile_start:tile_stop] + world_y).tolist())),
+                'doors': list(zip((room_doors_x[door_start:door_stop] + world_x).tolist(), (room_doors_y[door_start:door_stop] + world_y).tolist())),
+            })
+            tile_start, door_start = tile_stop, door_stop
+        chunks[chunk_pos] = {'position': chunk_pos, 'grid': grid, 'spawns': [], 'rooms': rooms}
+
+    for n, x, y, entity_type, subtype in spawns.tolist():
+        chunk = chunks[chunk_list[n]]
+        chunk['spawns'].append({'position': (x, y), 'entity_type': names[entity_type], 'subtype': names[subtype]})
+
+    return floor_data, chunks
+
+# The floor for a seed from the cache, generated (every chunk of it) and saved first if it isn't there yet
+def cached_floor(seed):
+    path = floor_cache_path(seed)
+    if os.path.exists(path):
+        try:
+            return read_floor(path)
+        except (ValueError, KeyError, struct.error) as e:
+            print('Floor cache unusable, generating again:', e)
+
+    floor_data = generate_floor(seed)
+    chunks = {}
+    for chunk_pos in floor_data['chunks']:
+        chunks[chunk_pos] = generate_chunk(floor_data, floor_data['chunk-properties'][chunk_pos])
+    write_floor(path, floor_data, chunks)
+    return floor_data, chunks
@@ -5,7 +5,7 @@ import random
 import math
 
 from offset import OffsetGroup
-from sprite import BasicSprite
+from sprite import BasicSprite, preload_images
 from world import GameWorld
 from text import MonoFont, MonoText
 
@@ -26,6 +26,8 @@ def initialize():
     GameSettings.scaler = math.floor((screen_info.current_h * .9) / GameSettings.internal_h)
     real_screen = pygame.display.set_mode(get_real_res(), flags)
 
+    preload_images()
+
     return real_screen
 
 def shutdown():
@@ -33,12 +35,61 @@ def shutdown():
 # Stuff outside of my restart loop
 ######################################
 
+# Combine overlapping rects and cut them down to the screen
+def merge_dirty_rects(rects, screen_rect):
+    merged = []
+    for rect in rects:
+        rect = rect.clip(screen_rect)
+        if rect.width == 0 or rect.height == 0:
+            continue
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+# Scale the internal screen up to the real screen and show it
+# dirty is a list of the areas that changed, or None to present the whole thing
+# scaled_screen is a real resolution surface to scale into so a new one isn't made every frame
+def present(screen, scaled_screen, real_screen, dirty):
+    real_w, real_h = scaled_screen.get_size()
+    w, h = screen.get_size()
+    # Scaling pieces separately only gives the same result when each pixel becomes a whole number of pixels
+    if dirty is not None and (real_w % w != 0 or real_h % h != 0):
+        dirty = None
+
+    if dirty is not None:
+        dirty = merge_dirty_rects(dirty, screen.get_rect())
+        if sum(rect.width * rect.height for rect in dirty) > (w * h) // 2:
+            dirty = None
+
+    if dirty is None:
+        pygame.transform.scale(screen, (real_w, real_h), scaled_screen)
+        real_screen.blit(scaled_screen, (0, 0))
+        pygame.display.flip()
+        return
+
+    if len(dirty) == 0:
+        return
+
+    scale_x, scale_y = real_w // w, real_h // h
+    real_rects = []
+    for rect in dirty:
+        real_rect = pygame.Rect(rect.x * scale_x, rect.y * scale_y, rect.width * scale_x, rect.height * scale_y)
+        pygame.transform.scale(screen.subsurface(rect), real_rect.size, scaled_screen.subsurface(real_rect))
+        real_screen.blit(scaled_screen, real_rect, real_rect)
+        real_rects.append(real_rect)
+    pygame.display.update(real_rects)
+
 # here we go
 def main(real_screen):
     if len(sys.argv) > 1:
         GameSettings.game_scale = int(sys.argv[1])
     screen = pygame.Surface(get_internal_res())
     screen = screen.convert()
+    scaled_screen = pygame.Surface(get_real_res())
+    scaled_screen = scaled_screen.convert()
 
     background = pygame.Surface(screen.get_size())
     background = background.convert()
@@ -61,6 +112,7 @@ def main(real_screen):
 
     debug_font_pixel = MonoFont('0123456789', 'outline_numbers', 6, 9, 0)
     debug_text_pixel = MonoText(1, debug_font_pixel, '00')
+    fps_rect = pygame.Rect(4, 4, 0, 0)
 
     render_list = []
     render_list.append(world)
@@ -68,10 +120,19 @@ def main(real_screen):
     # game loop
     running = True
     while running:
+        if world.is_idle():
+            # Turn based, so there's nothing to draw until something happens
+            event = pygame.event.wait(GameSettings.idle_wait_timeout)
+            if event.type != NOEVENT:
+                pygame.event.post(event)
         clock.tick(60)
-        for event in pygame.event.get(QUIT):
+
+        show_everything = False
+        for event in pygame.event.get((QUIT, WINDOWEXPOSED)):
             if event.type == QUIT:
                 running = False
+            elif event.type == WINDOWEXPOSED:
+                show_everything = True
 
         status = world.update()
         running = running and status
@@ -80,17 +141,34 @@ def main(real_screen):
 
         # draw stuff
         screen.blit(background, (0, 0))
+        dirty = []
         for render_obj in render_list:
-            render_obj.render(camera, screen)
+            render_dirty = render_obj.render(camera, screen)
+            if render_dirty is None or dirty is None:
+                dirty = None
+            else:
+                dirty.extend(render_dirty)
 
         if GameSettings.enable_fps:
             fps = str(math.floor(clock.get_fps()))
             #debug_font.render_to(screen, debug_text_rect, fps)
             debug_text_pixel.set_text(fps)
-            screen.blit(debug_text_pixel.image, (4, 4))
-
-        real_screen.blit(pygame.transform.scale(screen, get_real_res()), (0, 0))
-        pygame.display.flip()
+            new_fps_rect = screen.blit(debug_text_pixel.image, (4, 4))
+            if dirty is not None:
+                dirty.append(new_fps_rect.union(fps_rect))
+            fps_rect = new_fps_rect
+        elif fps_rect.width:
+            # fps got turned off, the old counter is still on the real screen until that spot gets presented once more
+            if dirty is not None:
+                dirty.append(fps_rect)
+            fps_rect = pygame.Rect(4, 4, 0, 0)
+
+        if show_everything or not GameSettings.dirty_rect_rendering:
+            dirty = None
+        present(screen, scaled_screen, real_screen, dirty)
+
+    if GameSettings.debug_mode:
+        world.print_stats()
 
     return world.restart
 
@@ -1,10 +1,27 @@
 from constants import *
 
-import random
 import math
-from tilemap import TileMap
+import collections
 
-def generate_floor():
+import numpy as np
+
+from noise_random import NoiseRandom, stream_seed, noise_grid_2d, ints_in_range
+
+# Generation only works out data, a ChunkGrid of tiles plus records of the entities to spawn, so it
+# doesn't need pygame or a GameWorld. GameWorld.build_chunk turns the result into a TileMap and entities
+#
+# Everything random comes from the floor seed, each chunk (and each room in it) draws from its own stream
+# made from (floor seed, chunk position, what it's for), so a chunk comes out the same whatever order
+# chunks are generated in or whichever thread does it
+
+FLOOR_VARIANTS = 2
+
+# Bump this whenever a change here (or in noise_random.py) makes a seed come out as a different floor,
+# floors saved in the floor cache by an older version get thrown out and generated again
+GENERATOR_VERSION = 1
+
+def generate_floor(seed):
+    rng = NoiseRandom(stream_seed(seed, 'floor'))
     worms = 2
     chunks_per = 4
     chunks = set()
@@ -28,19 +45,19 @@ def generate_floor():
             if chunk_pos not in chunks:
                 chunks.add(chunk_pos)
 
-                shape = random.choices(chunk_shapes, weights=shape_weights)[0]
+                shape = rng.choices(chunk_shapes, weights=shape_weights)[0]
                 chunk_properties[chunk_pos] = {'position': chunk_pos, 'shape': shape}
                 if shape == 'huge-rooms':
                     chunk_properties[chunk_pos]['max-depth'] = 3
                 elif shape == 'outer-loop':
-                    ring_width = random.randint(3, 5)
+                    ring_width = rng.randint(3, 5)
                     chunk_properties[chunk_pos]['ring-start'] = ring_width 
                     chunk_properties[chunk_pos]['ring-stop'] = TM_CHUNK_SIZE - 2 - ring_width 
                 set_chunks += 1
 
-                chunk_properties[chunk_pos]['color'] = random.choices(chunk_colors, weights=color_weights)[0]
+                chunk_properties[chunk_pos]['color'] = rng.choices(chunk_colors, weights=color_weights)[0]
 
-            xd, yd = random.choice(directions)
+            xd, yd = rng.choice(directions)
             cur_x += xd
             cur_y += yd
 
@@ -50,38 +67,117 @@ def generate_floor():
         this_chunk_x, this_chunk_y = chunk_pos
 
         if (this_chunk_x + 1, this_chunk_y) in chunks:
-            doors[(this_chunk_x, this_chunk_y, 'right')] = random.randint(1, TM_CHUNK_SIZE - 3)
+            doors[(this_chunk_x, this_chunk_y, 'right')] = rng.randint(1, TM_CHUNK_SIZE - 3)
 
         if (this_chunk_x, this_chunk_y + 1) in chunks:
-            doors[(this_chunk_x, this_chunk_y, 'down')] = random.randint(1, TM_CHUNK_SIZE - 3)
+            doors[(this_chunk_x, this_chunk_y, 'down')] = rng.randint(1, TM_CHUNK_SIZE - 3)
 
-    ret = {'chunks': chunks, 'chunk-properties': chunk_properties, 'doors': doors}
-    ret['starting-chunk'] = random.choice(list(chunks)) 
+    ret = {'seed': seed, 'chunks': chunks, 'chunk-properties': chunk_properties, 'doors': doors}
+    ret['starting-chunk'] = rng.choice(list(chunks)) 
     ret['spawn'] = (1, 1)
     if chunk_properties[ret['starting-chunk']]['shape'] == 'outer-loop':
         start_pos = chunk_properties[ret['starting-chunk']]['ring-start'] + 2
         ret['spawn'] = (start_pos, start_pos)
+
     return ret
 
 
-def generate_chunk(world, floor_data, chunk_properties):
-    chunk_pos = chunk_properties['position']
+# The tiles of one chunk as arrays indexed [x, y], what TileMap gets filled from
+# variants index into tile_names which only has the images this chunk used
+class ChunkGrid:
+    def __init__(self):
+        self.kinds = np.zeros((TM_CHUNK_SIZE, TM_CHUNK_SIZE), dtype=np.uint8)
+        self.variants = np.zeros((TM_CHUNK_SIZE, TM_CHUNK_SIZE), dtype=np.uint8)
+        # Tiles overlap a little so they have to be drawn in the order they were placed
+        self.place_order = np.zeros((TM_CHUNK_SIZE, TM_CHUNK_SIZE), dtype=np.int32)
+        self.placed_count = 0
+        # Which room each tile is in, filled in by label_rooms (-1 for walls and door tiles)
+        self.room_ids = np.full((TM_CHUNK_SIZE, TM_CHUNK_SIZE), -1, dtype=np.int16)
+
+        self.tile_names = []
+        self.tile_name_ids = {}
+
+    def tile_name_id(self, tile_img):
+        if tile_img not in self.tile_name_ids:
+            self.tile_name_ids[tile_img] = len(self.tile_names)
+            self.tile_names.append(tile_img)
+        return self.tile_name_ids[tile_img]
+
+    def place_tile(self, x, y, tile_img):
+        self.kinds[x, y] = TILE_FLOOR
+        self.variants[x, y] = self.tile_name_id(tile_img)
+        self.placed_count += 1
+        self.place_order[x, y] = self.placed_count
+
+    # Fill the w by h box in the corner with tiles at once, placed in the same order as
+    # calling place_tile column by column, tile_imgs[choices[x, y]] is the image for each tile
+    def place_tile_box(self, w, h, tile_imgs, choices):
+        name_ids = np.array([self.tile_name_id(tile_img) for tile_img in tile_imgs], dtype=np.uint8)
+        self.kinds[:w, :h] = TILE_FLOOR
+        self.variants[:w, :h] = name_ids[choices[:w, :h]]
+        self.place_order[:w, :h] = self.placed_count + 1 + np.arange(w * h).reshape(w, h)
+        self.placed_count += w * h
+
+    def clear_tile(self, x, y):
+        self.kinds[x, y] = TILE_NONE
+
+    def has_tile(self, x, y):
+        if x < 0 or y < 0 or x >= TM_CHUNK_SIZE or y >= TM_CHUNK_SIZE:
+            return False
+        return self.kinds[x, y] != TILE_NONE
+
+    # (x, y) of every tile in the chunk
+    def tile_positions(self):
+        return [(int(x), int(y)) for x, y in np.argwhere(self.kinds != TILE_NONE)]
+
+# Something for GameWorld.build_chunk to make at a position in the chunk, in the order they should be made
+def add_spawn(chunk, x, y, entity_type, subtype):
+    chunk['spawns'].append({'position': (x, y), 'entity_type': entity_type, 'subtype': subtype})
+
+# Random numbers for one part of a chunk's generation
+def chunk_stream(floor_data, chunk_pos, purpose, *keys):
     chunk_x, chunk_y = chunk_pos
-    tile_map = TileMap(chunk_x, chunk_y)
-    world.add_chunk(chunk_x, chunk_y, tile_map)
+    return NoiseRandom(stream_seed(floor_data['seed'], chunk_x, chunk_y, purpose, *keys))
 
-    visible = GameSettings.debug_mode
+# Which plain floor image goes on each tile of a chunk, straight from noise at its position
+# indexed [x, y], 0 for floor1 and so on
+def floor_variant_grid(floor_data, chunk_pos):
+    chunk_x, chunk_y = chunk_pos
+    noise = noise_grid_2d(0, 0, TM_CHUNK_SIZE, TM_CHUNK_SIZE, stream_seed(floor_data['seed'], chunk_x, chunk_y, 'floor-tiles'))
+    return ints_in_range(noise, 0, FLOOR_VARIANTS - 1)
 
-    floor_prefix = chunk_properties['color'] + '_'
-    floor_variants = 2
+def floor_tile_imgs(chunk_properties):
+    return [chunk_properties['color'] + '_floor' + str(variant + 1) for variant in range(FLOOR_VARIANTS)]
+
+def floor_tile_img(chunk_properties, floor_variants, x, y):
+    return floor_tile_imgs(chunk_properties)[floor_variants[x, y]]
 
-    def floor_tile_img():
-        return floor_prefix + 'floor' + str(random.randint(1, floor_variants))
+def chunk_coord_to_world_coord(chunk_pos, in_chunk_x, in_chunk_y):
+    chunk_x, chunk_y = chunk_pos
+    return (in_chunk_x + (chunk_x * TM_CHUNK_SIZE), in_chunk_y + (chunk_y * TM_CHUNK_SIZE))
+
+# Whether there's a tile at a position, in chunk coords
+# Just past the top or left edge is the last row/column of the chunk next to it, the only tiles there are
+# its inter-chunk doors so that comes from floor_data and it doesn't matter if that chunk is generated yet
+def tile_at(chunk, floor_data, x, y):
+    chunk_x, chunk_y = chunk['position']
+    if x == -1 and y >= 0:
+        return floor_data['doors'].get((chunk_x - 1, chunk_y, 'right')) == y
+    if y == -1 and x >= 0:
+        return floor_data['doors'].get((chunk_x, chunk_y - 1, 'down')) == x
+    return chunk['grid'].has_tile(x, y)
+
+# Work out everything in a chunk, returns
+#   {'position': chunk_pos, 'grid': ChunkGrid, 'spawns': [spawn records], 'rooms': [room info, see label_rooms]}
+def generate_chunk(floor_data, chunk_properties):
+    chunk_pos = chunk_properties['position']
+    rng = chunk_stream(floor_data, chunk_pos, 'layout')
+    floor_variants = floor_variant_grid(floor_data, chunk_pos)
+    tile_map = ChunkGrid()
+    chunk = {'position': chunk_pos, 'grid': tile_map, 'spawns': [], 'rooms': []}
 
     # Fill whole chunk first
-    for x in range(TM_CHUNK_SIZE - 1):
-        for y in range(TM_CHUNK_SIZE - 1):
-            tile_map.place_tile(x, y, visible, floor_tile_img())
+    tile_map.place_tile_box(TM_CHUNK_SIZE - 1, TM_CHUNK_SIZE - 1, floor_tile_imgs(chunk_properties), floor_variants)
 
 
     # chopper settings by chunk shape
@@ -103,27 +199,28 @@ def generate_chunk(world, floor_data, chunk_properties):
             tile_map.clear_tile(stop_pos, ring_y)
 
         # make a few doors into the inside
-        door_pos_h = start_pos + random.randint(1, stop_pos - start_pos - 1)
-        door_pos_v = start_pos + random.randint(1, stop_pos - start_pos - 1)
+        door_pos_h = start_pos + rng.randint(1, stop_pos - start_pos - 1)
+        door_pos_v = start_pos + rng.randint(1, stop_pos - start_pos - 1)
 
-        door_x = random.choice([start_pos, stop_pos])
-        door_y = random.choice([start_pos, stop_pos])
+        door_x = rng.choice([start_pos, stop_pos])
+        door_y = rng.choice([start_pos, stop_pos])
 
-        tile_map.place_tile(door_x, door_pos_v, visible, floor_tile_img())
-        world_x, world_y = world.chunk_coord_to_world_coord(chunk_pos, door_x, door_pos_v)
-        world.add_entity_at(world_x, world_y, visible, 'door', 'door')
+        tile_map.place_tile(door_x, door_pos_v, floor_tile_img(chunk_properties, floor_variants, door_x, door_pos_v))
+        add_spawn(chunk, door_x, door_pos_v, 'door', 'door')
 
-        tile_map.place_tile(door_pos_h, door_y, visible, floor_tile_img())
-        world_x, world_y = world.chunk_coord_to_world_coord(chunk_pos, door_pos_h, door_y)
-        world.add_entity_at(world_x, world_y, visible, 'door', 'door')
+        tile_map.place_tile(door_pos_h, door_y, floor_tile_img(chunk_properties, floor_variants, door_pos_h, door_y))
+        add_spawn(chunk, door_pos_h, door_y, 'door', 'door')
 
-        outer_ring_furnisher(world, chunk_properties, tile_map, start_pos, stop_pos)
+        outer_ring_furnisher(chunk, chunk_properties, floor_data, start_pos, stop_pos)
 
-    place_doors(world, tile_map, chunk_pos, chunk_properties, floor_data)
+    place_doors(chunk, chunk_properties, floor_data, floor_variants)
     # Chop up vertically and horizontally to create irregular rooms
-    recursive_room_chopper(world, tile_map, chunk_properties, floor_data, x, y, w, h, 1)
+    recursive_room_chopper(rng, chunk, chunk_properties, floor_data, x, y, w, h, 1)
+
+    label_rooms(chunk, floor_data)
+    return chunk
 
-def recursive_room_chopper(world, tile_map, chunk_properties, floor_data, x, y, w, h, depth):
+def recursive_room_chopper(rng, chunk, chunk_properties, floor_data, x, y, w, h, depth):
     done = False
     # infinite recursion protection
     if depth > 25:
@@ -146,11 +243,11 @@ def recursive_room_chopper(world, tile_map, chunk_properties, floor_data, x, y,
     elif area <= 100:
         cut_chance = 92
 
-    if random.randint(1, 100) > cut_chance:
+    if rng.randint(1, 100) > cut_chance:
         done = True
 
     if done:
-        rectangle_room_furnisher(world, chunk_properties, tile_map, x, y, w, h)
+        rectangle_room_furnisher(chunk, chunk_properties, floor_data, x, y, w, h)
         return
 
     chunk_pos = chunk_properties['position']
@@ -164,13 +261,13 @@ def recursive_room_chopper(world, tile_map, chunk_properties, floor_data, x, y,
         if w < h:
             vertical = False
         elif w == h:
-            vertical = random.choice([True, False])
+            vertical = rng.choice([True, False])
 
         long_side = w if vertical else h
-        slice_position = 3 + random.randint(0, long_side - 7)
+        slice_position = 3 + rng.randint(0, long_side - 7)
 
         short_side = h if vertical else w
-        door_position = random.randint(0, short_side - 1)
+        door_position = rng.randint(0, short_side - 1)
 
         valid_cut = True
         #######################
@@ -206,9 +303,7 @@ def recursive_room_chopper(world, tile_map, chunk_properties, floor_data, x, y,
 
         # Door could be in an adjacent chunk so check it properly
         for door_check_x, door_check_y in dc_positions:
-            world_x, world_y = world.chunk_coord_to_world_coord(chunk_pos, door_check_x, door_check_y)
-            stuff = world.what_is_at(world_x, world_y)
-            if stuff['tile']:
+            if tile_at(chunk, floor_data, door_check_x, door_check_y):
                 # theres some tile in the wall, I can assume theres a door there
                 #print("Stopped an invalid cut")
                 valid_cut = False
@@ -218,7 +313,7 @@ def recursive_room_chopper(world, tile_map, chunk_properties, floor_data, x, y,
         cut_tries -= 1
         if cut_tries < 0:
             # couldn't get a valid cut in a few tries so we'll just not cut this room any further
-            rectangle_room_furnisher(world, chunk_properties, tile_map, x, y, w, h)
+            rectangle_room_furnisher(chunk, chunk_properties, floor_data, x, y, w, h)
             return
         # End while not valid_cut
 
@@ -230,23 +325,21 @@ def recursive_room_chopper(world, tile_map, chunk_properties, floor_data, x, y,
         vy += i if vertical else slice_position
         if i == door_position:
             # Chance to place closed door
-            if random.randint(1, 6) < 6:
-                visible = GameSettings.debug_mode
-
-                world_x, world_y = world.chunk_coord_to_world_coord(chunk_pos, vx, vy)
-                door = world.add_entity_at(world_x, world_y, visible, 'door', 'door')
+            if rng.randint(1, 6) < 6:
+                add_spawn(chunk, vx, vy, 'door', 'door')
         else:
-            tile_map.clear_tile(vx, vy)
+            chunk['grid'].clear_tile(vx, vy)
 
     # Recurse
     if vertical:
-        recursive_room_chopper(world, tile_map, chunk_properties, floor_data, x, y, slice_position, h, depth + 1)
-        recursive_room_chopper(world, tile_map, chunk_properties, floor_data, x + slice_position + 1, y, w - 1 - slice_position, h, depth + 1)
+        recursive_room_chopper(rng, chunk, chunk_properties, floor_data, x, y, slice_position, h, depth + 1)
+        recursive_room_chopper(rng, chunk, chunk_properties, floor_data, x + slice_position + 1, y, w - 1 - slice_position, h, depth + 1)
     else:
-        recursive_room_chopper(world, tile_map, chunk_properties, floor_data, x, y, w, slice_position, depth + 1)
-        recursive_room_chopper(world, tile_map, chunk_properties, floor_data, x, y + slice_position + 1, w, h - 1 - slice_position, depth + 1)
+        recursive_room_chopper(rng, chunk, chunk_properties, floor_data, x, y, w, slice_position, depth + 1)
+        recursive_room_chopper(rng, chunk, chunk_properties, floor_data, x, y + slice_position + 1, w, h - 1 - slice_position, depth + 1)
 
-def rectangle_room_furnisher(world, chunk_properties, tile_map, x, y, w, h):
+def rectangle_room_furnisher(chunk, chunk_properties, floor_data, x, y, w, h):
+    rng = chunk_stream(floor_data, chunk['position'], 'room', x, y)
     all_tiles = set()
 
     for i in range(x, x + w):
@@ -261,7 +354,7 @@ def rectangle_room_furnisher(world, chunk_properties, tile_map, x, y, w, h):
         if area > 100:
             supports_chance = 95
 
-        if random.randint(1, 100) <= supports_chance:
+        if rng.randint(1, 100) <= supports_chance:
             # cut out some tiles in the middle like they are pillars supporting the ceiling
             vertical = h > w
 
@@ -280,16 +373,16 @@ def rectangle_room_furnisher(world, chunk_properties, tile_map, x, y, w, h):
             def offset(coord):
                 return (coord[0] + x, coord[1] + y)
 
-            pillar_shape = random.choice(['square', '+', '-', 'H'])
+            pillar_shape = rng.choice(['square', '+', '-', 'H'])
 
             for i in range(1, divisions):
                 pillar_coord = (middle, math.floor(spacing * i))
                 if not vertical:
                     pillar_coord = flipped(pillar_coord)
-                removed_tiles = place_pillar(tile_map, offset(pillar_coord), pillar_shape, center_wide, vertical)
+                removed_tiles = place_pillar(chunk['grid'], offset(pillar_coord), pillar_shape, center_wide, vertical)
                 all_tiles -= removed_tiles
 
-    room_furnisher(world, chunk_properties, tile_map, all_tiles)
+    room_furnisher(rng, chunk, chunk_properties, all_tiles)
 
 def place_pillar(tile_map, position, shape, is_wide, wide_on_x):
     cut_tiles = set()
@@ -359,7 +452,8 @@ def place_pillar(tile_map, position, shape, is_wide, wide_on_x):
     return cut_tiles
 
 
-def outer_ring_furnisher(world, chunk_properties, tile_map, ring_start, ring_stop):
+def outer_ring_furnisher(chunk, chunk_properties, floor_data, ring_start, ring_stop):
+    rng = chunk_stream(floor_data, chunk['position'], 'ring')
     all_tiles = set()
 
     for i in range(0, TM_CHUNK_SIZE - 1):
@@ -370,33 +464,32 @@ def outer_ring_furnisher(world, chunk_properties, tile_map, ring_start, ring_sto
 
     def cut(x, y):
         all_tiles.remove((x, y))
-        tile_map.clear_tile(x, y)
+        chunk['grid'].clear_tile(x, y)
 
     cut_corner_chance = 60
-    if random.randint(1, 100) <= cut_corner_chance:
+    if rng.randint(1, 100) <= cut_corner_chance:
         cut(0, 0)
         cut(TM_CHUNK_SIZE - 2, 0)
         cut(0, TM_CHUNK_SIZE - 2)
         cut(TM_CHUNK_SIZE - 2, TM_CHUNK_SIZE - 2)
 
-    room_furnisher(world, chunk_properties, tile_map, all_tiles)
+    room_furnisher(rng, chunk, chunk_properties, all_tiles)
 
-def room_furnisher(world, chunk_properties, tile_map, all_tiles):
+def room_furnisher(rng, chunk, chunk_properties, all_tiles):
     area = len(all_tiles)
-    chunk_pos = chunk_properties['position']
 
     if area <= 12:
-        include_enemies = random.choice([0, 0, 0, 0, 0, 1, 1])
-        include_pots = random.choice([0, 0, 1, 1, 2])
+        include_enemies = rng.choice([0, 0, 0, 0, 0, 1, 1])
+        include_pots = rng.choice([0, 0, 1, 1, 2])
     elif area <= 35:
-        include_enemies = random.choice([0, 0, 0, 0, 1, 1, 2])
-        include_pots = random.choice([0, 0, 0, 1, 2])
+        include_enemies = rng.choice([0, 0, 0, 0, 1, 1, 2])
+        include_pots = rng.choice([0, 0, 0, 1, 2])
     elif area <= 55:
-        include_enemies = random.choice([0, 0, 0, 1, 1, 2, 3])
-        include_pots = random.choice([0, 1, 1, 3, 6])
+        include_enemies = rng.choice([0, 0, 0, 1, 1, 2, 3])
+        include_pots = rng.choice([0, 1, 1, 3, 6])
     else:
-        include_enemies = random.choice([0, 0, 1, 2, 4, 5, 6])
-        include_pots = random.choice([0, 2, 5, 7, 8])
+        include_enemies = rng.choice([0, 0, 1, 2, 4, 5, 6])
+        include_pots = rng.choice([0, 2, 5, 7, 8])
 
     # dont pack the room full of stuff
     max_things = area // 3
@@ -405,13 +498,11 @@ def room_furnisher(world, chunk_properties, tile_map, all_tiles):
 
     unused_spots = list(all_tiles)
 
-    visible = GameSettings.debug_mode
-
     # Random chance that first pot in a room gets replaced with a chest
-    do_chest = random.randint(1, 10) < 2
+    do_chest = rng.randint(1, 10) < 2
 
     for i in range(include_pots):
-        spot = random.choice(unused_spots)
+        spot = rng.choice(unused_spots)
         unused_spots.remove(spot)
         spot_x, spot_y = spot
 
@@ -419,8 +510,7 @@ def room_furnisher(world, chunk_properties, tile_map, all_tiles):
         if i == 0 and do_chest:
             subtype = 'chest'
 
-        world_x, world_y = world.chunk_coord_to_world_coord(chunk_pos, spot_x, spot_y)
-        world.add_entity_at(world_x, world_y, visible, 'bustable', subtype)
+        add_spawn(chunk, spot_x, spot_y, 'bustable', subtype)
 
         stuff_so_far += 1
         if stuff_so_far >= max_things:
@@ -438,21 +528,20 @@ def room_furnisher(world, chunk_properties, tile_map, all_tiles):
         ['eyepod'],
     ]
     enemy_set_weights = [6, 9, 6, 6, 4, 1, 1, 3, 1]
-    enemy_set = random.choices(enemy_sets, weights=enemy_set_weights)[0]
+    enemy_set = rng.choices(enemy_sets, weights=enemy_set_weights)[0]
 
     # Only spawn eyepod by himself
     if enemy_set == ['eyepod']:
         include_enemies = 1
 
     for i in range(include_enemies):
-        spot = random.choice(unused_spots)
+        spot = rng.choice(unused_spots)
         unused_spots.remove(spot)
         spot_x, spot_y = spot
 
-        enemy_type = random.choice(enemy_set)
+        enemy_type = rng.choice(enemy_set)
 
-        world_x, world_y = world.chunk_coord_to_world_coord(chunk_pos, spot_x, spot_y)
-        world.add_entity_at(world_x, world_y, visible, 'creature', enemy_type)
+        add_spawn(chunk, spot_x, spot_y, 'creature', enemy_type)
 
         stuff_so_far += 1
         if stuff_so_far >= max_things:
@@ -468,50 +557,95 @@ def room_furnisher(world, chunk_properties, tile_map, all_tiles):
     def rare_tile_img():
         if rare_variants < 2:
             return floor_prefix + 'floor3'
-        return floor_prefix + 'floor' + str(random.randint(1, rare_variants) + 2)
+        return floor_prefix + 'floor' + str(rng.randint(1, rare_variants) + 2)
 
     if rare_variants > 0:
         # 50% chance of a few rare variants
         # 25% chance of a lot of rare variants
         cracks_count = 0
-        if random.randint(1, 2) == 2:
+        if rng.randint(1, 2) == 2:
             cracks_count = area // 10
-        elif random.randint(1, 2) == 2:
+        elif rng.randint(1, 2) == 2:
             cracks_count = area // 5
 
         for i in range(cracks_count):
             if len(unused_spots) < 1:
                 break
-            spot = random.choice(unused_spots)
+            spot = rng.choice(unused_spots)
             unused_spots.remove(spot)
             spot_x, spot_y = spot
 
-            tile_map.clear_tile(spot_x, spot_y)
-            tile_map.place_tile(spot_x, spot_y, visible, rare_tile_img())
+            chunk['grid'].clear_tile(spot_x, spot_y)
+            chunk['grid'].place_tile(spot_x, spot_y, rare_tile_img())
 
 # Place inter-chunk tiles and doors
 # do it before chopping rooms so they can avoid chopping right next to the doors
-def place_doors(world, tile_map, chunk_pos, chunk_properties, floor_data):
-    chunk_x, chunk_y = chunk_pos
-    visible = GameSettings.debug_mode
-
-    floor_prefix = chunk_properties['color'] + '_'
-    floor_variants = 2
-
-    def floor_tile_img():
-        return floor_prefix + 'floor' + str(random.randint(1, floor_variants))
+def place_doors(chunk, chunk_properties, floor_data, floor_variants):
+    chunk_x, chunk_y = chunk['position']
+    tile_map = chunk['grid']
 
     if (chunk_x, chunk_y, 'right') in floor_data['doors']:
         door_y = floor_data['doors'][(chunk_x, chunk_y, 'right')]
         door_x = TM_CHUNK_SIZE - 1
-        tile_map.place_tile(door_x, door_y, visible, floor_tile_img())
-
-        world_x, world_y = world.chunk_coord_to_world_coord(chunk_pos, door_x, door_y)
-        door = world.add_entity_at(world_x, world_y, visible, 'door', 'door')
+        tile_map.place_tile(door_x, door_y, floor_tile_img(chunk_properties, floor_variants, door_x, door_y))
+        add_spawn(chunk, door_x, door_y, 'door', 'door')
     if (chunk_x, chunk_y, 'down') in floor_data['doors']:
         door_x = floor_data['doors'][(chunk_x, chunk_y, 'down')]
         door_y = TM_CHUNK_SIZE - 1
-        tile_map.place_tile(door_x, door_y, visible, floor_tile_img())
-
-        world_x, world_y = world.chunk_coord_to_world_coord(chunk_pos, door_x, door_y)
-        door = world.add_entity_at(world_x, world_y, visible, 'door', 'door')
+        tile_map.place_tile(door_x, door_y, floor_tile_img(chunk_properties, floor_variants, door_x, door_y))
+        add_spawn(chunk, door_x, door_y, 'door', 'door')
+
+# Record which room every tile belongs to so reveals don't have to flood fill to find out
+# A room is a 4-connected area of floor bounded by walls and door tiles, gaps left in a wall
+# without a door join the rooms on either side into one
+# Fills the grid's room_ids (-1 for walls and door tiles) and chunk['rooms'], room n of the chunk is
+#   {'tiles': [world positions], 'doors': [door tile world positions]}
+# GameWorld.build_chunk adds them to world.rooms as (chunk_x, chunk_y, n)
+def label_rooms(chunk, floor_data):
+    chunk_pos = chunk['position']
+    chunk_x, chunk_y = chunk_pos
+    tile_map = chunk['grid']
+    adjacents = [(-1, 0), (0, -1), (1, 0), (0, 1)]
+
+    door_spawns = {spawn['position'] for spawn in chunk['spawns'] if spawn['entity_type'] == 'door'}
+    floor_tiles = set()
+    door_tiles = set()
+    for x, y in tile_map.tile_positions():
+        if (x, y) in door_spawns:
+            door_tiles.add((x, y))
+        else:
+            floor_tiles.add((x, y))
+
+    # Door tiles of the chunks to the left and above sit just outside this chunk
+    outside_doors = set()
+    if (chunk_x - 1, chunk_y, 'right') in floor_data['doors']:
+        outside_doors.add((-1, floor_data['doors'][(chunk_x - 1, chunk_y, 'right')]))
+    if (chunk_x, chunk_y - 1, 'down') in floor_data['doors']:
+        outside_doors.add((floor_data['doors'][(chunk_x, chunk_y - 1, 'down')], -1))
+
+    room_ids = tile_map.room_ids
+    room_count = 0
+    for first_tile in floor_tiles:
+        if room_ids[first_tile] != -1:
+            continue
+
+        room_ids[first_tile] = room_count
+        tiles = []
+        doors = set()
+        to_check = collections.deque([first_tile])
+        while to_check:
+            x, y = to_check.popleft()
+            tiles.append((x, y))
+            for dx, dy in adjacents:
+                adj = (x + dx, y + dy)
+                if adj in door_tiles or adj in outside_doors:
+                    doors.add(adj)
+                elif adj in floor_tiles and room_ids[adj] == -1:
+                    room_ids[adj] = room_count
+                    to_check.append(adj)
+
+        chunk['rooms'].append({
+            'tiles': [chunk_coord_to_world_coord(chunk_pos, x, y) for x, y in tiles],
+            'doors': [chunk_coord_to_world_coord(chunk_pos, x, y) for x, y in doors],
+        })
+        room_count += 1
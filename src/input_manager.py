@@ -36,6 +36,10 @@ class InputManager:
     def is_key_down(self, key):
         return key in self.down_keys
 
+    # Held keys can still do things (button repeats) without any new events
+    def any_key_down(self):
+        return len(self.down_keys) > 0
+
     def update(self, events, delta_time):
         for event in events:
             if event.type == KEYDOWN:
@@ -1,6 +1,9 @@
 import time
 
-32_bit = 2**32
+import numpy as np
+
+BIT_32 = 2**32
+MASK_32 = BIT_32 - 1
 
 ###############################################################################################
 # algorithm from Squirrel Eiserloh's 2017 GDC talk: Math for Game Programmers: Noise-Based RNG
@@ -10,24 +13,39 @@ NOISE2 = 0x68e31da4
 NOISE3 = 0x1b56c4e9
 
 def timeseed():
-    return time.time() % 32_bit
+    return time.time() % BIT_32
 
-# might not get same results when not reducing to 32-bit int at each step
-# something to check I guess, should make one that does and compare some outputs for big inputs (just generate some)
+# squirrel3 is a 32 bit algorithm, so everything gets cut down to 32 bits at each step like it would be in C
+# only reducing at the end doesn't give the same numbers, the right shifts pull the extra high bits back down
+# this is the reference the numpy version below is checked against (tests/test_noise_random.py)
 def squirrel3_seeded_hash(n, seed):
-    n *= NOISE1
-    n += seed
+    n = (n * NOISE1) & MASK_32
+    n = (n + seed) & MASK_32
     n ^= n >> 8
-    n += NOISE2
-    n ^= n << 8
-    n *= NOISE3
+    n = (n + NOISE2) & MASK_32
+    n ^= (n << 8) & MASK_32
+    n = (n * NOISE3) & MASK_32
     n ^= n >> 8
+    return n
 
-    # squirrel3 is a 32 bit algorithm
-    # this gets the right result but isn't the fastest, should be more than fast enough for me
-    return n % 32_bit
+# Same thing for a whole array of positions at once, returns uint32 noise in the same shape
+# numpy wraps uint32 math on its own so the steps are the same as above
+def squirrel3_batch(positions, seed):
+    n = np.asarray(positions).astype(np.uint32)
+    n *= np.uint32(NOISE1)
+    n += np.uint32(seed & MASK_32)
+    n ^= n >> np.uint32(8)
+    n += np.uint32(NOISE2)
+    n ^= n << np.uint32(8)
+    n *= np.uint32(NOISE3)
+    n ^= n >> np.uint32(8)
+    return n
 ###############################################################################################
 
+# Large primes with interesting bit patterns, for mapping 2d/3d positions to 1d noise positions
+PRIME_Y = 198491317
+PRIME_Z = 6542989
+
 # these noise funcitons take an integer position
 def get_seeded_noise(position, seed):
     return squirrel3_seeded_hash(position, seed)
@@ -35,11 +53,86 @@ def get_seeded_noise(position, seed):
 def get_2d_seeded_noise(x, y, seed):
     # multiply y by large prime with interesting bit pattern, then add to x
     # pretty good and fast result to map 1d noise to 2d
-    # y_prime = 198491317
-    return get_seeded_noise((y * 198491317) + x, seed)
+    return get_seeded_noise((y * PRIME_Y) + x, seed)
+
+def get_3d_seeded_noise(x, y, z, seed):
+    return get_seeded_noise((z * PRIME_Z) + (y * PRIME_Y) + x, seed)
+
+# Noise for every position in a w by h box starting at x, y, indexed [x, y] like the tile maps
+# element [i, j] is get_2d_seeded_noise(x + i, y + j, seed)
+def noise_grid_2d(x, y, w, h, seed):
+    xs = np.arange(x, x + w).astype(np.uint32)[:, None]
+    ys = np.arange(y, y + h).astype(np.uint32)[None, :]
+    return squirrel3_batch(ys * np.uint32(PRIME_Y) + xs, seed)
+
+# element [i, j, k] is get_3d_seeded_noise(x + i, y + j, z + k, seed)
+def noise_grid_3d(x, y, z, w, h, d, seed):
+    xs = np.arange(x, x + w).astype(np.uint32)[:, None, None]
+    ys = np.arange(y, y + h).astype(np.uint32)[None, :, None]
+    zs = np.arange(z, z + d).astype(np.uint32)[None, None, :]
+    return squirrel3_batch(zs * np.uint32(PRIME_Z) + ys * np.uint32(PRIME_Y) + xs, seed)
+
+# 32-bit int -> int in range low..high (inclusive)
+# scales instead of using % so every result is about as likely
+def int_in_range(value, low, high):
+    return low + ((value * (high - low + 1)) >> 32)
+
+# int_in_range for a whole array of noise
+def ints_in_range(values, low, high):
+    return low + ((np.asarray(values).astype(np.uint64) * np.uint64(high - low + 1)) >> np.uint64(32)).astype(np.int64)
+
+# 32-bit int -> index into weights, each index as likely as its weight
+def weighted_index(value, weights):
+    target = value * sum(weights) / BIT_32
+    total = 0
+    for i, weight in enumerate(weights):
+        total += weight
+        if target < total:
+            return i
+    return len(weights) - 1
+
+# Mix any number of ints and strings into one seed, like (floor seed, chunk x, chunk y, 'rooms')
+# The same keys always give the same seed, in any run (unlike hash() for strings)
+def stream_seed(seed, *keys):
+    for key in keys:
+        if isinstance(key, str):
+            for byte in key.encode():
+                seed = squirrel3_seeded_hash(byte, seed)
+        else:
+            seed = squirrel3_seeded_hash(key, seed)
+    return seed
+
+# Sequential random numbers, the nth number is just noise at position n so nothing depends on
+# anything else being drawn first, streams made from different stream_seed keys don't affect each other
+# Has the parts of random.Random that generation uses
+class NoiseRandom:
+    def __init__(self, seed, position = 0):
+        self.seed = seed
+        self.position = position
+
+    def next_u32(self):
+        value = squirrel3_seeded_hash(self.position, self.seed)
+        self.position += 1
+        return value
+
+    def random(self):
+        return self.next_u32() / BIT_32
+
+    def getrandbits(self, k):
+        if k > 32:
+            return (self.getrandbits(k - 32) << 32) | self.next_u32()
+        return self.next_u32() >> (32 - k)
+
+    def randint(self, a, b):
+        return int_in_range(self.next_u32(), a, b)
+
+    def choice(self, seq):
+        return seq[int_in_range(self.next_u32(), 0, len(seq) - 1)]
+
+    def choices(self, population, weights = None, k = 1):
+        if weights is None:
+            return [self.choice(population) for i in range(k)]
+        return [population[weighted_index(self.next_u32(), weights)] for i in range(k)]
 
 # TODO:
-#   class for sequential random number fetching
-#   function for 32-bit int -> int in range a..b
-#   funciton for weighted choice from list
-#   multiple choices from list
+#   multiple choices from list without repeats
@@ -1,16 +1,91 @@
 import pygame
 
 class OffsetGroup(pygame.sprite.LayeredUpdates):
-    def __init__(self, *sprites, **kwargs):
+    # grid_size: if set, sprites are also kept in a grid of grid_size pixel cells (by their top left corner)
+    # so draw only has to look at the cells that are on screen, sprites can't be bigger than a cell
+    def __init__(self, *sprites, grid_size=None, **kwargs):
+        self.grid_size = grid_size
+        self.grid = {}
+        self.sprite_cells = {}
+        # Sprites in a layer are drawn in the order they were added to it
+        self.sprite_order = {}
+        self.next_order = 0
+        # Sprites that were blitted last draw and the image they were drawn with
+        self.drawn = set()
+        self.drawn_images = {}
+
         super().__init__(*sprites, **kwargs)
         self.offset_x = 0
         self.offset_y = 0
         self.cam_offset_x = 0
         self.cam_offset_y = 0
 
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.sprite_order[sprite] = self.next_order
+        self.next_order += 1
+        if self.grid_size is not None:
+            self.sprite_moved(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        del self.sprite_order[sprite]
+        self.drawn.discard(sprite)
+        self.drawn_images.pop(sprite, None)
+        if sprite in self.sprite_cells:
+            self.grid[self.sprite_cells.pop(sprite)].discard(sprite)
+
+    def change_layer(self, sprite, new_layer):
+        super().change_layer(sprite, new_layer)
+        self.sprite_order[sprite] = self.next_order
+        self.next_order += 1
+
+    # Called by BasicSprite whenever its rect moves
+    def sprite_moved(self, sprite):
+        if self.grid_size is None:
+            return
+        cell = (sprite.rect.x // self.grid_size, sprite.rect.y // self.grid_size)
+        old_cell = self.sprite_cells.get(sprite)
+        if old_cell == cell:
+            return
+        if old_cell is not None:
+            self.grid[old_cell].discard(sprite)
+        if cell not in self.grid:
+            self.grid[cell] = set()
+        self.grid[cell].add(sprite)
+        self.sprite_cells[sprite] = cell
+
+    # Sprites that might overlap a rect, in the order they should be drawn
+    def sprites_in_rect(self, rect):
+        if self.grid_size is None:
+            return self.sprites()
+
+        size = self.grid_size
+        # Sprites stick out right and down from their cell by up to a whole cell
+        x1, y1 = (rect.left - size) // size, (rect.top - size) // size
+        x2, y2 = rect.right // size, rect.bottom // size
+        found = []
+        grid = self.grid
+        if (x2 - x1 + 1) * (y2 - y1 + 1) > len(grid):
+            for (cell_x, cell_y), cell_sprites in grid.items():
+                if x1 <= cell_x <= x2 and y1 <= cell_y <= y2:
+                    found.extend(cell_sprites)
+        else:
+            for cell_x in range(x1, x2 + 1):
+                for cell_y in range(y1, y2 + 1):
+                    if (cell_x, cell_y) in grid:
+                        found.extend(grid[(cell_x, cell_y)])
+
+        layers = self._spritelayers
+        order = self.sprite_order
+        found.sort(key=lambda spr: (layers[spr], order[spr]))
+        return found
+
     def draw(self, surface):
         """draw all visible sprites in the right order onto the passed surface
         sprites are offset by the group offset
+        only sprites that are on the surface (or its clip area) get drawn
+        sprites that look the same and are in the same spot as last draw don't add dirty rects
         idk how the dirty code works I just copied it lmao
 
         LayeredUpdates.draw(surface): return Rect_list
@@ -22,22 +97,34 @@ class OffsetGroup(pygame.sprite.LayeredUpdates):
         self.lostsprites = []
         dirty_append = dirty.append
         init_rect = self._init_rect
-        for cur_layer in self.layers():
-            for spr in self.get_sprites_from_layer(cur_layer):
-                if not spr.visible:
-                    continue
-                rec = spritedict[spr]
-                sprite_rect = spr.rect.move(-self.offset_x, -self.offset_y)
-                newrect = surface_blit(spr.image, sprite_rect)
-                if rec is init_rect:
-                    dirty_append(newrect)
+
+        view = surface.get_clip().move(self.offset_x, self.offset_y)
+        drawn = set()
+        drawn_images = self.drawn_images
+        for spr in self.sprites_in_rect(view):
+            if not spr.visible or not view.colliderect(spr.rect):
+                continue
+            drawn.add(spr)
+            rec = spritedict[spr]
+            sprite_rect = spr.rect.move(-self.offset_x, -self.offset_y)
+            newrect = surface_blit(spr.image, sprite_rect)
+            if rec is init_rect:
+                dirty_append(newrect)
+            elif newrect != rec or drawn_images[spr] is not spr.image or spr.image_changed:
+                if newrect.colliderect(rec):
+                    dirty_append(newrect.union(rec))
                 else:
-                    if newrect.colliderect(rec):
-                        dirty_append(newrect.union(rec))
-                    else:
-                        dirty_append(newrect)
-                        dirty_append(rec)
-                spritedict[spr] = newrect
+                    dirty_append(newrect)
+                    dirty_append(rec)
+            spritedict[spr] = newrect
+            drawn_images[spr] = spr.image
+            spr.image_changed = False
+
+        # Wherever a sprite was that isn't drawn anymore needs to be cleared
+        for spr in self.drawn - drawn:
+            dirty_append(spritedict[spr])
+            spritedict[spr] = init_rect
+        self.drawn = drawn
 
         return dirty
 
@@ -51,4 +138,4 @@ class OffsetGroup(pygame.sprite.LayeredUpdates):
 
     def render(self, camera, surface):
         self.set_offset(camera)
-        self.draw(surface)
+        return self.draw(surface)
@@ -0,0 +1,138 @@
+from constants import *
+
+import collections
+import heapq
+
+import numpy as np
+
+# Pathfinding on a flattened copy of the pathfinding window
+# The window gets a wall border all the way around so neighbor lookups never need a bounds check
+# cell index for window coordinate (x, y) is (x + 1) * stride + (y + 1)
+
+WALL = 10
+
+# Same order GameWorld.pathfind has always checked neighbors in
+NEIGHBOR_DELTAS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+def padded_grid(window):
+    w, h = window.shape
+    padded = np.full((w + 2, h + 2), WALL, dtype=np.int8)
+    padded[1:-1, 1:-1] = window
+    return padded.ravel().tolist(), h + 2
+
+def cell_index(stride, x, y):
+    return (x + 1) * stride + (y + 1)
+
+# (offset, is_diagonal, straight offset a, straight offset b) for each neighbor delta
+def neighbor_offsets(stride):
+    offsets = []
+    for dx, dy in NEIGHBOR_DELTAS:
+        offsets.append((dx * stride + dy, dx != 0 and dy != 0, dx * stride, dy))
+    return offsets
+
+# Breadth first distances from root to every cell that can reach it
+# Uses the same movement rules as GameWorld.pathfind, read backwards:
+#   moving into a cell needs its value <= strength, except the root itself (attacking the player)
+#   diagonal moves need at least one of the two orthogonal cells beside them to be open
+# Cells that can't be walked through (like other creatures) still get a distance so things
+# standing on them know how far they are, they just don't spread the search any further
+def distance_field(grid, stride, root, strength):
+    dist = [-1] * len(grid)
+    dist[root] = 0
+    offsets = neighbor_offsets(stride)
+
+    queue = collections.deque([root])
+    while queue:
+        cur = queue.popleft()
+        next_dist = dist[cur] + 1
+        for offset, diagonal, straight_x, straight_y in offsets:
+            prev = cur - offset
+            if dist[prev] != -1:
+                continue
+            if diagonal and grid[prev + straight_x] > strength and grid[prev + straight_y] > strength:
+                continue
+            dist[prev] = next_dist
+            if grid[prev] <= strength:
+                queue.append(prev)
+
+    return dist
+
+# The best step (dx, dy) from a cell according to a distance field, or False if it can't reach the root
+def field_step(grid, stride, dist, cell, strength):
+    cur_dist = dist[cell]
+    if cur_dist < 1:
+        return False
+
+    best = False
+    best_dist = cur_dist
+    for (dx, dy), (offset, diagonal, straight_x, straight_y) in zip(NEIGHBOR_DELTAS, neighbor_offsets(stride)):
+        adj = cell + offset
+        adj_dist = dist[adj]
+        if adj_dist == -1 or adj_dist >= best_dist:
+            continue
+        if grid[adj] > strength and adj_dist != 0:
+            continue
+        if diagonal and grid[cell + straight_x] > strength and grid[cell + straight_y] > strength:
+            continue
+        best = (dx, dy)
+        best_dist = adj_dist
+
+    return best
+
+# A* from start to dest (flat cell indices), returns the cells along the path not including start
+# or False if there isn't one within max_expansions expanded nodes
+# Every step costs 1 including diagonals so the octile heuristic is just the chebyshev distance
+def astar(grid, stride, start, dest, strength, max_expansions=PATHFINDING_MAX_EXPANSIONS):
+    offsets = neighbor_offsets(stride)
+    dest_x, dest_y = divmod(dest, stride)
+
+    came_from = {start: -1}
+    cost = {start: 0}
+    closed = set()
+    # priority que items go in the list as: (priority, cell)
+    frontier = [(0, start)]
+    heappush = heapq.heappush
+    heappop = heapq.heappop
+
+    expansions = 0
+    while frontier:
+        _, cur = heappop(frontier)
+        if cur == dest:
+            break
+        if cur in closed:
+            # stale entry, this cell was already expanded with a lower cost
+            continue
+        closed.add(cur)
+
+        expansions += 1
+        if expansions > max_expansions:
+            return False
+
+        next_cost = cost[cur] + 1
+        for offset, diagonal, straight_x, straight_y in offsets:
+            adj = cur + offset
+            if adj in closed:
+                continue
+            # If the node is the destination, ignore strength (attack player)
+            if grid[adj] > strength and adj != dest:
+                continue
+            # diagonal movement needs to be a valid path orthogonally too
+            if diagonal and grid[cur + straight_x] > strength and grid[cur + straight_y] > strength:
+                continue
+            if adj in cost and cost[adj] <= next_cost:
+                continue
+            cost[adj] = next_cost
+            came_from[adj] = cur
+
+            adj_x, adj_y = divmod(adj, stride)
+            heappush(frontier, (next_cost + max(abs(adj_x - dest_x), abs(adj_y - dest_y)), adj))
+    else:
+        return False
+
+    path = []
+    cur = dest
+    while cur != start:
+        path.append(cur)
+        cur = came_from[cur]
+    path.reverse()
+    return path
@@ -0,0 +1,229 @@
+from constants import *
+
+import collections
+import heapq
+
+from pathfinding import NEIGHBOR_DELTAS
+
+# Coarse pathfinding over the whole floor using the inter-chunk doors from generate_floor as portals
+# Each chunk knows how far each of its portals is from the others, and how far every portal is from
+# each portal of the destination's chunk is worked out once over that small graph and kept until something changes
+# Only the stretch from the start to the first portal gets walked out tile by tile
+#
+# Uses the same movement as GameWorld.pathfind but only cares about the layout of the floor:
+# no tile, closed doors and bustables are walls, creatures are ignored since they move around
+class PortalGraph:
+    def __init__(self, world, floor_data):
+        self.world = world
+
+        # door tile world position -> the two chunks it connects
+        self.portals = {}
+        # chunk -> door tile world positions on its edges
+        self.chunk_portals = collections.defaultdict(list)
+        for (chunk_x, chunk_y, direction), door_pos in floor_data['doors'].items():
+            if direction == 'right':
+                in_chunk = (TM_CHUNK_SIZE - 1, door_pos)
+                other_chunk = (chunk_x + 1, chunk_y)
+            else:
+                in_chunk = (door_pos, TM_CHUNK_SIZE - 1)
+                other_chunk = (chunk_x, chunk_y + 1)
+            position = world.chunk_coord_to_world_coord((chunk_x, chunk_y), in_chunk[0], in_chunk[1])
+            self.portals[position] = ((chunk_x, chunk_y), other_chunk)
+            self.chunk_portals[(chunk_x, chunk_y)].append(position)
+            self.chunk_portals[other_chunk].append(position)
+
+        # chunk -> set of open world positions, includes the door tiles of the chunks to the left and above
+        self.chunk_open = {}
+        # chunk -> {portal: {other portal: steps}}
+        self.chunk_costs = {}
+
+        # goal portal -> ({portal: steps to goal}, {portal: next portal on the way to goal})
+        # any chunk changing can change the best way anywhere so these all go together
+        self.routes = {}
+        # (dest, chunk_search from it), every chaser going after the player in a turn has the same dest
+        self.dest_search = None
+
+        # metrics
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate_chunk(self, chunk):
+        self.chunk_open.pop(chunk, None)
+        self.chunk_costs.pop(chunk, None)
+        self.routes = {}
+        self.dest_search = None
+
+    # Something that blocks movement changed at a world position
+    # Door tiles on the right/bottom edge are also part of the neighboring chunk's search area
+    def invalidate_at(self, x, y):
+        _, _, chunk_x, chunk_y = self.world.translate_chunk_coords(x, y)
+        self.invalidate_chunk((chunk_x, chunk_y))
+        self.invalidate_chunk((chunk_x + 1, chunk_y))
+        self.invalidate_chunk((chunk_x, chunk_y + 1))
+
+    def open_cells(self, chunk):
+        if chunk in self.chunk_open:
+            return self.chunk_open[chunk]
+
+        world = self.world
+        origin_x, origin_y = world.chunk_coord_to_world_coord(chunk, 0, 0)
+        open_cells = set()
+        if world.chunk_exists(chunk[0], chunk[1]):
+            for x in range(origin_x - 1, origin_x + TM_CHUNK_SIZE):
+                for y in range(origin_y - 1, origin_y + TM_CHUNK_SIZE):
+                    stuff = world.what_is_at(x, y)
+                    if not stuff['tile']:
+                        continue
+                    blocked = False
+                    for e in stuff['entities']:
+                        if e.entity_type == 'bustable' or (e.entity_type == 'door' and e.closed):
+                            blocked = True
+                    if not blocked:
+                        open_cells.add((x, y))
+
+        self.chunk_open[chunk] = open_cells
+        return open_cells
+
+    # Breadth first search inside one chunk, returns (steps, came_from) dicts keyed by world position
+    # The start doesn't have to be open (it's usually the creature doing the searching)
+    def chunk_search(self, chunk, start):
+        open_cells = self.open_cells(chunk)
+        steps = {start: 0}
+        came_from = {start: None}
+        queue = collections.deque([start])
+        while queue:
+            cur = queue.popleft()
+            cur_x, cur_y = cur
+            next_steps = steps[cur] + 1
+            for dx, dy in NEIGHBOR_DELTAS:
+                adj = (cur_x + dx, cur_y + dy)
+                if adj in steps or adj not in open_cells:
+                    continue
+                if dx != 0 and dy != 0 and (cur_x + dx, cur_y) not in open_cells and (cur_x, cur_y + dy) not in open_cells:
+                    continue
+                steps[adj] = next_steps
+                came_from[adj] = cur
+                queue.append(adj)
+        return steps, came_from
+
+    def portal_costs(self, chunk):
+        if chunk in self.chunk_costs:
+            return self.chunk_costs[chunk]
+
+        costs = {}
+        open_cells = self.open_cells(chunk)
+        for portal in self.chunk_portals[chunk]:
+            if portal not in open_cells:
+                continue
+            steps, _ = self.chunk_search(chunk, portal)
+            costs[portal] = {}
+            for other in self.chunk_portals[chunk]:
+                if other != portal and other in steps:
+                    costs[portal][other] = steps[other]
+
+        self.chunk_costs[chunk] = costs
+        return costs
+
+    # Shortest way from every portal to goal over the portal graph, steps inside a chunk are the same both ways
+    # so this is a Dijkstra outward from goal
+    def routes_to(self, goal):
+        if goal in self.routes:
+            self.hits += 1
+            return self.routes[goal]
+        self.misses += 1
+
+        steps_to = {goal: 0}
+        toward = {goal: None}
+        frontier = [(0, goal)]
+        while frontier:
+            steps, cur = heapq.heappop(frontier)
+            if steps > steps_to[cur]:
+                # stale entry
+                continue
+            for chunk in self.portals[cur]:
+                for other, other_steps in self.portal_costs(chunk).get(cur, {}).items():
+                    next_steps = steps + other_steps
+                    if other in steps_to and steps_to[other] <= next_steps:
+                        continue
+                    steps_to[other] = next_steps
+                    toward[other] = cur
+                    heapq.heappush(frontier, (next_steps, other))
+
+        self.routes[goal] = (steps_to, toward)
+        return self.routes[goal]
+
+    # Route from start to dest (world positions) through the portal graph
+    # Returns (waypoints, first_segment) where waypoints are the portals to pass through followed by dest
+    # and first_segment is the world positions from start up to the first waypoint, or False if there's no route
+    def find_route(self, start, dest):
+        world = self.world
+        _, _, start_cx, start_cy = world.translate_chunk_coords(start[0], start[1])
+        _, _, dest_cx, dest_cy = world.translate_chunk_coords(dest[0], dest[1])
+        start_chunk, dest_chunk = (start_cx, start_cy), (dest_cx, dest_cy)
+
+        # Standing in a doorway, the door tile is part of both chunks' search areas so start from both sides
+        start_searches = {}
+        for chunk in self.portals.get(start, (start_chunk,)):
+            start_searches[chunk] = self.chunk_search(chunk, start)
+
+        # The destination has to be reachable from inside its own chunk, search outward from it
+        # it's usually standing on a creature (the player) so don't require it to be open
+        if self.dest_search is None or self.dest_search[0] != dest:
+            self.dest_search = (dest, self.chunk_search(dest_chunk, dest))
+        dest_steps, _ = self.dest_search[1]
+
+        # Best of walking straight there inside the chunk, or out through a start portal
+        # across the graph and in through one of the destination chunk's portals
+        best_steps = None
+        best = None
+        for chunk, (start_steps, _) in start_searches.items():
+            if chunk == dest_chunk and dest in start_steps:
+                if best_steps is None or start_steps[dest] < best_steps:
+                    best_steps, best = start_steps[dest], (dest, None)
+        for goal in self.chunk_portals[dest_chunk]:
+            if goal not in dest_steps:
+                continue
+            steps_to, _ = self.routes_to(goal)
+            for chunk, (start_steps, _) in start_searches.items():
+                for portal in self.chunk_portals[chunk]:
+                    if portal == start or portal not in start_steps or portal not in steps_to:
+                        continue
+                    steps = start_steps[portal] + steps_to[portal] + dest_steps[goal]
+                    if best_steps is None or steps < best_steps:
+                        best_steps, best = steps, (portal, goal)
+
+        if best is None:
+            return False
+
+        first, goal = best
+        waypoints = []
+        if goal is not None:
+            _, toward = self.routes[goal]
+            cur = first
+            while cur is not None:
+                waypoints.append(cur)
+                cur = toward[cur]
+        if not waypoints or waypoints[-1] != dest:
+            waypoints.append(dest)
+
+        # Refine only the first stretch, everything after it might change before we get there
+        # through whichever side of the doorway got to the first waypoint quickest
+        searches = [search for search in start_searches.values() if first in search[0]]
+        _, start_came_from = min(searches, key=lambda search: search[0][first])
+        segment = []
+        cur = first
+        while cur != start:
+            segment.append(cur)
+            cur = start_came_from[cur]
+        segment.reverse()
+
+        return waypoints, segment
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+    def stats(self):
+        return "portal routes: " + str(self.hits) + " hits, " + str(self.misses) + " misses, " + str(round(self.hit_rate() * 100, 1)) + "% hit rate"
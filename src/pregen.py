@@ -0,0 +1,91 @@
+import heapq
+import threading
+
+from generation import generate_chunk
+
+# Generates the chunks of a floor in the background, closest to the player first, so by the time a reveal
+# reaches a chunk it's usually already worked out and GameWorld only has to build it (see GameWorld.build_chunk)
+# Chunks only draw from their own streams of the floor seed so they come out the same whichever thread makes them and whenever
+class ChunkPregenerator:
+    WORKERS = 1
+
+    # generated is chunk_pos -> chunk for any chunks that are already worked out (loaded from the floor cache)
+    def __init__(self, floor_data, near_chunk, generated = None):
+        self.floor_data = floor_data
+        self.lock = threading.Condition()
+
+        # chunk_pos -> generated chunk waiting to be taken
+        self.ready = dict(generated or {})
+        # (distance from near_chunk, chunk_pos) for chunks nobody has started on yet
+        self.queue = [(chunk_distance(chunk_pos, near_chunk), chunk_pos) for chunk_pos in floor_data['chunks'] if chunk_pos not in self.ready]
+        heapq.heapify(self.queue)
+        self.in_progress = set()
+
+        # Workers quit once the queue is empty, a floor only has a handful of chunks
+        self.workers = []
+        for i in range(ChunkPregenerator.WORKERS):
+            worker = threading.Thread(target=self.work, name='chunk-pregen-' + str(i), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def generate(self, chunk_pos):
+        return generate_chunk(self.floor_data, self.floor_data['chunk-properties'][chunk_pos])
+
+    def work(self):
+        while True:
+            with self.lock:
+                if not self.queue:
+                    return
+                _, chunk_pos = heapq.heappop(self.queue)
+                self.in_progress.add(chunk_pos)
+
+            chunk = None
+            try:
+                chunk = self.generate(chunk_pos)
+            finally:
+                with self.lock:
+                    self.in_progress.remove(chunk_pos)
+                    # If it failed whoever takes it generates it again and gets the error
+                    if chunk is not None:
+                        self.ready[chunk_pos] = chunk
+                    self.lock.notify_all()
+
+    # Player moved to a different chunk, work outward from there instead
+    def prioritize(self, near_chunk):
+        with self.lock:
+            self.queue = [(chunk_distance(chunk_pos, near_chunk), chunk_pos) for _, chunk_pos in self.queue]
+            heapq.heapify(self.queue)
+
+    # The generated chunk at chunk_pos if it's ready, each chunk can only be taken once
+    # Otherwise it gets moved to the front of the line (the rest stay in order of distance from the player)
+    # and this returns None, try again next frame
+    # If no worker is ever going to get to it (they all quit, or one failed on it) it's finished right here instead
+    def take(self, chunk_pos):
+        with self.lock:
+            if chunk_pos in self.ready:
+                return self.ready.pop(chunk_pos)
+            if chunk_pos in self.in_progress:
+                return None
+            queued = any(item[1] == chunk_pos for item in self.queue)
+            if queued and any(worker.is_alive() for worker in self.workers):
+                if (-1, chunk_pos) not in self.queue:
+                    self.queue = [(-1 if pos == chunk_pos else distance, pos) for distance, pos in self.queue]
+                    heapq.heapify(self.queue)
+                return None
+        return self.finish(chunk_pos)
+
+    # The generated chunk at chunk_pos, right now
+    # Waits if a worker is partway through it, if nobody has started on it it's generated right here
+    def finish(self, chunk_pos):
+        with self.lock:
+            while chunk_pos in self.in_progress:
+                self.lock.wait()
+            if chunk_pos in self.ready:
+                return self.ready.pop(chunk_pos)
+
+            self.queue = [item for item in self.queue if item[1] != chunk_pos]
+            heapq.heapify(self.queue)
+        return self.generate(chunk_pos)
+
+def chunk_distance(chunk_a, chunk_b):
+    return abs(chunk_a[0] - chunk_b[0]) + abs(chunk_a[1] - chunk_b[1])
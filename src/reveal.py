@@ -0,0 +1,186 @@
+from constants import *
+
+import collections
+import time
+
+# Flood fill that reveals hidden tiles and whatever is standing on them
+# Spreading stops at closed doors and tiles that are already visible
+# Work is spread across frames by time rather than by a number of tiles so a slow frame
+# doesn't make the next frame try to catch up and be even slower
+class RevealEngine:
+    ADJACENTS = [(-1, 0), (0, -1), (1, 0), (0, 1)]
+
+    def __init__(self, world):
+        self.world = world
+        self.to_check = collections.deque()
+        self.queued = set()
+
+        # when the current reveal (including any started while it was running) began
+        self.started_at = 0
+
+        # metrics
+        self.frames = 0
+        self.tiles_revealed = 0
+        self.max_tiles_per_frame = 0
+        self.reveals_finished = 0
+        self.total_latency = 0
+        self.max_latency = 0
+
+    def active(self):
+        return len(self.to_check) > 0
+
+    # Queue up a reveal starting at a world position, can be called while another one is still going
+    def start(self, x, y):
+        if not self.active():
+            self.started_at = time.perf_counter()
+        if (x, y) not in self.queued:
+            self.queued.add((x, y))
+            self.to_check.append((x, y))
+
+    # Reveal tiles until the queue runs out or the budget (in seconds) is used up
+    # returns True if there's more to do next frame
+    def step(self, budget):
+        if not self.active():
+            return False
+
+        world = self.world
+        frame_start = time.perf_counter()
+        revealed = 0
+        while self.to_check:
+            px, py = self.to_check[0]
+
+            # Chunks that aren't generated yet (see pregen.py) are waited on a frame at a time,
+            # the tile stays at the front of the queue until it and anywhere it could spread to are ready
+            generated_chunk = False
+            waiting = False
+            if world.pending_chunk_exists_at(px, py):
+                if not world.generate_chunk_at(px, py):
+                    break
+                generated_chunk = True
+            stuff_here = world.what_is_at(px, py)
+            stop_here = closed_door_in(stuff_here)
+            if not stop_here:
+                for dx, dy in RevealEngine.ADJACENTS:
+                    if world.pending_chunk_exists_at(px + dx, py + dy):
+                        if not world.generate_chunk_at(px + dx, py + dy):
+                            waiting = True
+                            break
+                        generated_chunk = True
+            if waiting:
+                break
+
+            self.to_check.popleft()
+            revealed += 1
+
+            # Show everything here
+            self.reveal_tile(px, py, stuff_here)
+            if world.in_pathfinding_window(px, py):
+                world.update_pathfinding_node(px, py, stuff=stuff_here)
+
+            if stop_here:
+                # A closed door isn't done with, if it gets opened before the reveal finishes
+                # start() has to be able to queue it again to spread through it
+                # it's visible now so the spread from its neighbours won't pick it back up
+                self.queued.discard((px, py))
+            else:
+                # Check all adjacent tiles for hidden tiles to show
+                for dx, dy in RevealEngine.ADJACENTS:
+                    nx, ny = (px + dx, py + dy)
+                    if (nx, ny) in self.queued:
+                        continue
+
+                    tile = world.get_tile_from_world_coord(nx, ny)
+                    if not tile or tile.visible:
+                        continue
+
+                    # Ok so this is a hidden tile, add it to the list
+                    self.queued.add((nx, ny))
+                    self.to_check.append((nx, ny))
+
+            # Generating a chunk is a big chunk of work by itself, let the frame finish after it
+            if generated_chunk or time.perf_counter() - frame_start > budget:
+                break
+
+        self.frames += 1
+        self.tiles_revealed += revealed
+        self.max_tiles_per_frame = max(self.max_tiles_per_frame, revealed)
+
+        if self.to_check:
+            return True
+
+        self.finish()
+        return False
+
+    # Show a tile and everything on it, stuff_here is what_is_at for it if that's already been looked up
+    def reveal_tile(self, x, y, stuff_here=None):
+        if stuff_here is None:
+            stuff_here = self.world.what_is_at(x, y)
+        self.world.set_tile_visible(x, y)
+
+        for e in stuff_here['entities']:
+            e.reveal()
+            if e.entity_type == 'door' and not e.closed:
+                e.visible = False
+
+    # Reveal whole rooms that generation already worked out (see generation.label_rooms) in one go
+    # x, y is where the reveal started from, usually the door that was just opened
+    def reveal_rooms(self, x, y, room_ids):
+        world = self.world
+        if not self.active():
+            self.started_at = time.perf_counter()
+
+        self.reveal_tile(x, y)
+        revealed = 1
+        for dx, dy in RevealEngine.ADJACENTS:
+            for e in world.what_is_at(x + dx, y + dy)['entities']:
+                if e.entity_type == 'door':
+                    self.reveal_tile(x + dx, y + dy)
+
+        for room_id in room_ids:
+            room = world.rooms[room_id]
+            if room['revealed']:
+                continue
+            room['revealed'] = True
+
+            for tile_x, tile_y in room['tiles']:
+                world.set_tile_visible(tile_x, tile_y)
+            for e in room['entities']:
+                e.reveal()
+            for door_x, door_y in room['doors']:
+                if world.pending_chunk_exists_at(door_x, door_y) and not world.generate_chunk_at(door_x, door_y):
+                    # Door is in a chunk that isn't ready yet, the flood fill can wait for it
+                    self.start(door_x, door_y)
+                    continue
+                self.reveal_tile(door_x, door_y)
+            revealed += len(room['tiles']) + len(room['doors'])
+
+        self.frames += 1
+        self.tiles_revealed += revealed
+        self.max_tiles_per_frame = max(self.max_tiles_per_frame, revealed)
+        if not self.active():
+            self.finish()
+
+    def finish(self):
+        self.queued = set()
+
+        latency = time.perf_counter() - self.started_at
+        self.reveals_finished += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+        # More tiles available for movement
+        self.world.update_whole_pathfinding_map()
+
+    def stats(self):
+        if self.frames == 0 or self.reveals_finished == 0:
+            return "reveal: nothing revealed"
+        tiles_per_frame = round(self.tiles_revealed / self.frames, 1)
+        avg_latency = round(self.total_latency / self.reveals_finished * 1000, 2)
+        return "reveal: " + str(self.tiles_revealed) + " tiles over " + str(self.frames) + " frames, " + str(tiles_per_frame) + " tiles/frame (max " + str(self.max_tiles_per_frame) + "), latency avg " + str(avg_latency) + "ms max " + str(round(self.max_latency * 1000, 2)) + "ms"
+
+# A closed door stops the spread of a reveal
+def closed_door_in(stuff):
+    for e in stuff['entities']:
+        if e.entity_type == 'door' and e.closed:
+            return True
+    return False
@@ -0,0 +1,148 @@
+import heapq
+
+from spatial import SpatialHash
+
+# Keeps track of which entities actually have to be looked at each turn, so a turn costs about as much as
+# the number of creatures near the player that are ready to move instead of the number of entities on the floor
+#
+# actors: revealed movers that are awake, each one is in a heap by the turn it gets to act next
+#   waiting (move_wait, a hit with no_wait_on_hit) just changes when that is, nothing counts down every turn
+# sleepers: revealed movers that fell asleep for being too far from the player, they don't move so they
+#   only need checking when the player does, found with a coarse spatial query around the player
+#   a sleeper's wait_counter is how many turns it still had to wait when it fell asleep
+class TurnScheduler:
+    SLEEPER_CELL_SIZE = 16
+
+    def __init__(self, world):
+        self.world = world
+
+        # The turn being worked out or, between turns, the next one
+        self.turn = 0
+
+        # slot -> entity
+        self.actors = {}
+        # slot -> turn it acts next, the heap has (turn, slot) and can have old entries that don't match this anymore
+        self.next_turn = {}
+        self.turn_queue = []
+
+        self.sleepers = SpatialHash(TurnScheduler.SLEEPER_CELL_SIZE)
+        self.max_sleep_distance = 0
+        # Where the player was the last time sleepers were checked
+        self.checked_from = None
+
+        # Entities that animate but don't take turns (the player)
+        self.still_animators = {}
+        # Entities with ongoing effects that count down every turn
+        self.effect_holders = {}
+
+    def in_world(self, entity):
+        return self.world.entity_store.entities[entity.slot] is entity
+
+    # Entity was added to the world's entity group
+    def attach(self, entity):
+        if entity.moves:
+            if not entity.hidden:
+                self.place(entity)
+        elif entity.animates:
+            self.still_animators[entity.slot] = entity
+        if entity.effects is not None:
+            self.effect_holders[entity.slot] = entity
+
+    def detach(self, entity):
+        self.actors.pop(entity.slot, None)
+        self.next_turn.pop(entity.slot, None)
+        self.sleepers.remove(entity)
+        self.still_animators.pop(entity.slot, None)
+        self.effect_holders.pop(entity.slot, None)
+
+    def schedule(self, entity, turn):
+        self.next_turn[entity.slot] = turn
+        heapq.heappush(self.turn_queue, (turn, entity.slot))
+
+    # Put a revealed mover in the right set for whether it's awake
+    def place(self, entity):
+        if entity.active:
+            self.sleepers.remove(entity)
+            if entity.slot not in self.actors:
+                self.actors[entity.slot] = entity
+                self.schedule(entity, self.turn + entity.wait_counter)
+        else:
+            if entity.slot in self.actors:
+                del self.actors[entity.slot]
+                entity.wait_counter = max(0, self.next_turn.pop(entity.slot) - self.turn)
+            self.sleepers.add(entity, entity.grid_x, entity.grid_y)
+            self.max_sleep_distance = max(self.max_sleep_distance, entity.sleep_distance)
+
+    def revealed(self, entity):
+        if self.in_world(entity):
+            self.place(entity)
+            # Could be close enough to wake up without the player moving
+            self.checked_from = None
+
+    def entity_moved(self, entity):
+        if entity in self.sleepers:
+            self.sleepers.move(entity, entity.grid_x, entity.grid_y)
+
+    # Stop waiting and act on the next turn that hasn't been worked out yet (counterattacking when hit)
+    def interrupt(self, entity):
+        entity.wait_counter = 0
+        if entity.slot in self.actors and self.next_turn[entity.slot] > self.turn:
+            self.schedule(entity, self.turn)
+
+    def track_effects(self, entity):
+        if self.in_world(entity):
+            self.effect_holders[entity.slot] = entity
+
+    # Entities that should animate this turn
+    def animated(self):
+        return list(self.still_animators.values()) + list(self.actors.values())
+
+    def with_effects(self):
+        return list(self.effect_holders.values())
+
+    def wake_nearby(self, player_x, player_y):
+        self.checked_from = (player_x, player_y)
+        reach = self.max_sleep_distance
+        for entity in self.sleepers.query_rect(player_x - reach, player_y - reach, player_x + reach, player_y + reach):
+            if not entity.far_offscreen():
+                entity.wake()
+                self.place(entity)
+
+    # Pop everything due this turn, in the order the entities were made
+    def due_actors(self):
+        due = []
+        queue = self.turn_queue
+        while queue and queue[0][0] <= self.turn:
+            turn, slot = heapq.heappop(queue)
+            if self.next_turn.get(slot) == turn:
+                due.append(slot)
+        due.sort()
+        return due
+
+    # Every actor that's due does its thing, far away ones get put to sleep first
+    def take_turn(self):
+        world = self.world
+        store = world.entity_store
+        player_x, player_y = world.get_player().get_grid_x_y()
+        if (player_x, player_y) != self.checked_from:
+            self.wake_nearby(player_x, player_y)
+
+        # Anything (awake) can end up too far away, either the player or it moved
+        for slot in store.too_far(list(self.actors), player_x, player_y):
+            entity = self.actors[slot]
+            entity.sleep()
+            self.place(entity)
+
+        entities = store.entities
+        for slot in self.due_actors():
+            entity = entities[slot]
+            # Might have been killed by something that acted before it
+            if entity is None or not entity.living:
+                continue
+            entity.wait_counter = 0
+            entity.act()
+            # act sets wait_counter to move_wait if it moved
+            if entity.slot in self.actors:
+                self.schedule(entity, self.turn + entity.wait_counter + 1)
+
+        self.turn += 1
@@ -0,0 +1,73 @@
+# Buckets objects by a grid cell so "what is here" is a dict lookup instead of a scan
+# cell_size 1 is a straight per-tile index, bigger cells are good for coarse area queries
+class SpatialHash:
+    def __init__(self, cell_size=1):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.positions = {}
+
+    def cell_of(self, x, y):
+        return x // self.cell_size, y // self.cell_size
+
+    def add(self, obj, x, y):
+        if obj in self.positions:
+            self.move(obj, x, y)
+            return
+        cell = self.cell_of(x, y)
+        self.positions[obj] = cell
+        if cell not in self.cells:
+            self.cells[cell] = [obj]
+        else:
+            self.cells[cell].append(obj)
+
+    def remove(self, obj):
+        if obj not in self.positions:
+            return
+        cell = self.positions.pop(obj)
+        bucket = self.cells[cell]
+        bucket.remove(obj)
+        if len(bucket) == 0:
+            del self.cells[cell]
+
+    def move(self, obj, x, y):
+        cell = self.cell_of(x, y)
+        if obj in self.positions:
+            if self.positions[obj] == cell:
+                return
+            self.remove(obj)
+        self.positions[obj] = cell
+        if cell not in self.cells:
+            self.cells[cell] = [obj]
+        else:
+            self.cells[cell].append(obj)
+
+    def at(self, x, y):
+        # Returns a copy so callers can kill things while looping over it
+        cell = self.cell_of(x, y)
+        if cell not in self.cells:
+            return []
+        return list(self.cells[cell])
+
+    # everything in cells overlapping the rectangle, inclusive of both corners
+    def query_rect(self, x1, y1, x2, y2):
+        cx1, cy1 = self.cell_of(x1, y1)
+        cx2, cy2 = self.cell_of(x2, y2)
+        found = []
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(self.cells):
+            # Big query compared to how full the hash is, cheaper to check every bucket
+            for (cx, cy), bucket in self.cells.items():
+                if cx1 <= cx <= cx2 and cy1 <= cy <= cy2:
+                    found.extend(bucket)
+            return found
+
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                if (cx, cy) in self.cells:
+                    found.extend(self.cells[(cx, cy)])
+        return found
+
+    def __contains__(self, obj):
+        return obj in self.positions
+
+    def __len__(self):
+        return len(self.positions)
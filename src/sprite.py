@@ -2,36 +2,82 @@ import os
 import pygame
 from pygame.locals import *
 
-def load_png_image(name):
-    # should probably cache image surfaces
-    # if I do I need to cache flipped versions too as blitting doesn't support flipping itself
-    path = os.path.join('assets', 'img', name + '.png')
-    img_surface = pygame.image.load(path)
-    img_surface = img_surface.convert_alpha()
+# Loaded images are cached for the whole run (including restarts) so sprites share surfaces
+# keyed by (name, flip_x, flip_y, scale) since blitting can't flip or scale by itself
+# Nothing should draw onto a surface it got from here, make its own with make_img instead
+s_image_cache = {}
+s_image_cache_hits = 0
+s_image_cache_misses = 0
+
+def load_png_image(name, flip_x=False, flip_y=False, scale=1):
+    global s_image_cache_hits, s_image_cache_misses
+    key = (name, flip_x, flip_y, scale)
+    if key in s_image_cache:
+        s_image_cache_hits += 1
+        img_surface = s_image_cache[key]
+        return img_surface, img_surface.get_rect()
+
+    s_image_cache_misses += 1
+    if flip_x or flip_y or scale != 1:
+        img_surface, rect = load_png_image(name)
+        if flip_x or flip_y:
+            img_surface = pygame.transform.flip(img_surface, flip_x, flip_y)
+        if scale != 1:
+            img_surface = pygame.transform.scale(img_surface, (rect.width * scale, rect.height * scale))
+    else:
+        path = os.path.join('assets', 'img', name + '.png')
+        img_surface = pygame.image.load(path)
+        img_surface = img_surface.convert_alpha()
+
+    s_image_cache[key] = img_surface
     return img_surface, img_surface.get_rect()
 
+# Load every image up front, needs the display to be set up first
+def preload_images():
+    img_dir = os.path.join('assets', 'img')
+    for file_name in sorted(os.listdir(img_dir)):
+        if file_name.endswith('.png'):
+            load_png_image(file_name[:-4])
+
+def image_cache_stats():
+    total = s_image_cache_hits + s_image_cache_misses
+    hit_rate = 0 if total == 0 else round(s_image_cache_hits / total * 100, 1)
+    return "image cache: " + str(len(s_image_cache)) + " surfaces, " + str(s_image_cache_hits) + " hits, " + str(s_image_cache_misses) + " misses, " + str(hit_rate) + "% hit rate"
+
 
 class BasicSprite(pygame.sprite.Sprite):
     def __init__(self, img_name='no_img', visible=True, layer=0):
         super().__init__()
         self.load_img(img_name)
         self.layer = layer
+        # Set when something draws onto this sprite's own image so groups know it has to be presented again
+        self.image_changed = False
 
         self.visible = visible
 
     def load_img(self, img_name):
         self.image, self.rect = load_png_image(img_name)
+        self.moved()
 
     def make_img(self, w, h):
         self.image = pygame.Surface((w, h), SRCALPHA)
         self.rect = self.image.get_rect()
+        self.moved()
 
     def set_tl_pos(self, x, y):
         self.rect.x = x
         self.rect.y = y
+        self.moved()
 
     def set_pos(self, x, y):
         self.rect.center = (x, y)
+        self.moved()
+
+    # Let groups that keep track of where their sprites are (OffsetGroup) know the rect changed
+    def moved(self):
+        for group in self.groups():
+            if hasattr(group, 'sprite_moved'):
+                group.sprite_moved(self)
 
     def get_pos(self):
         return self.rect.center
@@ -9,7 +9,8 @@ class MonoText(BasicSprite):
         self.font = mono_font
         self.text = text
         self.text_dirty = True
-        self.old_len = 0
+        # -1 so the first draw always makes its own surface, the one from BasicSprite is shared
+        self.old_len = -1
         self.align = align
 
         super().__init__('no_img', True, layer)
@@ -50,6 +51,7 @@ class MonoText(BasicSprite):
             self.old_len = total_len
 
         self.image.fill(pygame.Color(0, 0, 0, 0))
+        self.image_changed = True
         if amount < 1:
             start_x = 0
             if self.align == 'right':
@@ -1,15 +1,71 @@
 from constants import *
 
-from offset import OffsetGroup
-from sprite import BasicSprite
+import numpy as np
+import pygame
+from pygame.locals import *
 
+from sprite import load_png_image
+
+# Every tile image name used by any chunk, the variant arrays store indexes into this
+s_tile_image_names = []
+s_tile_image_ids = {}
+
+def tile_image_id(img_name):
+    if img_name not in s_tile_image_ids:
+        s_tile_image_ids[img_name] = len(s_tile_image_names)
+        s_tile_image_names.append(img_name)
+    return s_tile_image_ids[img_name]
+
+# Space around the baked chunk surface for tiles on the edges that stick out past their grid space
+TILE_BAKE_MARGIN = GRID_WIDTH
+
+def tile_surface(image_id):
+    img_surface, _ = load_png_image(s_tile_image_names[image_id])
+    return img_surface
+
+# Lightweight handle for one tile, what get_tile returns instead of a sprite
+class TileView:
+    __slots__ = ('tile_map', 'x', 'y')
+
+    def __init__(self, tile_map, x, y):
+        self.tile_map = tile_map
+        self.x = x
+        self.y = y
+
+    @property
+    def visible(self):
+        return bool(self.tile_map.visible[self.x, self.y])
+
+    @visible.setter
+    def visible(self, visible):
+        self.tile_map.set_tile_visible(self.x, self.y, visible)
+
+    @property
+    def img_name(self):
+        return s_tile_image_names[self.tile_map.variants[self.x, self.y]]
+
+# One chunk of floor, stored as arrays indexed [x, y]
+# Nothing pygame related is made until the chunk actually gets drawn
 class TileMap:
     def __init__(self, chunk_x = 0, chunk_y = 0):
-        #self.chunks = {}
+        self.kinds = np.zeros((TM_CHUNK_SIZE, TM_CHUNK_SIZE), dtype=np.uint8)
+        self.variants = np.zeros((TM_CHUNK_SIZE, TM_CHUNK_SIZE), dtype=np.uint8)
+        self.visible = np.zeros((TM_CHUNK_SIZE, TM_CHUNK_SIZE), dtype=bool)
+        # Tiles overlap a little so they have to be drawn in the order they were placed
+        self.place_order = np.zeros((TM_CHUNK_SIZE, TM_CHUNK_SIZE), dtype=np.int32)
+        self.placed_count = 0
 
-        self.tiles = {}
+        # Pathfinding cost of each tile by itself, indexed [x, y]
+        # 0 is a visible floor tile, 10 is a wall or a tile that hasn't been revealed yet
+        self.path_costs = np.full((TM_CHUNK_SIZE, TM_CHUNK_SIZE), 10, dtype=np.int8)
 
-        self.sprite_container = OffsetGroup()
+        # Which room each tile is in, from generation.label_rooms (-1 for walls and door tiles)
+        self.room_ids = np.full((TM_CHUNK_SIZE, TM_CHUNK_SIZE), -1, dtype=np.int16)
+
+        # Every visible tile drawn onto one surface, made on the first render
+        # changes only mark the tiles they touch, that area gets redrawn on the next render
+        self.baked = None
+        self.dirty_area = None
 
         #display is currently 200x150
         offset_x, offset_y = get_screen_center_offset()
@@ -20,29 +76,116 @@ class TileMap:
     def set_origin(self, x, y):
         self.x_origin = x
         self.y_origin = y
-        self.sprite_container.set_camera_offset(x, y)
+
+    # Fill in the whole chunk from a generation.ChunkGrid
+    def load_grid(self, grid, visible):
+        image_ids = np.array([tile_image_id(name) for name in grid.tile_names] + [0], dtype=np.uint8)
+        self.kinds[:] = grid.kinds
+        self.variants[:] = image_ids[grid.variants]
+        self.visible[:] = (grid.kinds != TILE_NONE) & visible
+        self.place_order[:] = grid.place_order
+        self.placed_count = grid.placed_count
+        self.path_costs[:] = np.where(self.visible, 0, 10)
+        self.room_ids[:] = grid.room_ids
+        self.release_bake()
 
     def place_tile(self, x, y, visible=True, tile_img = 'floor'):
-        self.clear_tile(x, y)
-        if y not in self.tiles:
-            self.tiles[y] = {}
-        sp = BasicSprite(tile_img, visible)
-        sp.set_pos(x * GRID_WIDTH, y * GRID_WIDTH)
-        self.sprite_container.add(sp)
-        self.tiles[y][x] = sp
+        self.kinds[x, y] = TILE_FLOOR
+        self.variants[x, y] = tile_image_id(tile_img)
+        self.visible[x, y] = visible
+        self.placed_count += 1
+        self.place_order[x, y] = self.placed_count
+        self.path_costs[x, y] = 0 if visible else 10
+        self.mark_dirty(x, y)
 
     def clear_tile(self, x, y):
-        if y in self.tiles and x in self.tiles[y]:
-            self.tiles[y][x].kill()
-            del self.tiles[y][x]
+        if self.kinds[x, y] == TILE_NONE:
+            return
+        self.kinds[x, y] = TILE_NONE
+        self.visible[x, y] = False
+        self.path_costs[x, y] = 10
+        self.mark_dirty(x, y)
+
+    def set_tile_visible(self, x, y, visible=True):
+        if self.kinds[x, y] == TILE_NONE or self.visible[x, y] == visible:
+            return
+        self.visible[x, y] = visible
+        self.path_costs[x, y] = 0 if visible else 10
+        self.mark_dirty(x, y)
 
     def get_tile(self, x, y):
-        if y not in self.tiles or x not in self.tiles[y]:
+        if x < 0 or y < 0 or x >= TM_CHUNK_SIZE or y >= TM_CHUNK_SIZE or self.kinds[x, y] == TILE_NONE:
             return False
 
-        return self.tiles[y][x]
-    
+        return TileView(self, x, y)
+
+    # (x, y) of every tile in the chunk
+    def tile_positions(self):
+        return [(int(x), int(y)) for x, y in np.argwhere(self.kinds != TILE_NONE)]
+
+    # Grow the area to redraw to include a tile, kept as a box of tiles (x1, y1, x2, y2)
+    def mark_dirty(self, x, y):
+        if self.baked is None:
+            return
+        if self.dirty_area is None:
+            self.dirty_area = (x, y, x, y)
+        else:
+            x1, y1, x2, y2 = self.dirty_area
+            self.dirty_area = (min(x1, x), min(y1, y), max(x2, x), max(y2, y))
+
+    # Throw away the baked surface, it gets made again if the chunk is drawn again
+    def release_bake(self):
+        self.baked = None
+        self.dirty_area = None
+
+    def bake(self):
+        size = (TM_CHUNK_SIZE + 1) * GRID_WIDTH
+        self.baked = pygame.Surface((size, size), SRCALPHA)
+        self.dirty_area = None
+        self.bake_area(0, 0, TM_CHUNK_SIZE - 1, TM_CHUNK_SIZE - 1)
+
+    # Redraw a box of tiles on the baked surface
+    # Tile images can reach up to a whole grid space past their own, so the tiles around the box
+    # are drawn too (clipped to the box) in case they overlap it
+    def bake_area(self, x1, y1, x2, y2):
+        margin = TILE_BAKE_MARGIN
+        clip = pygame.Rect(x1 * GRID_WIDTH + margin - GRID_WIDTH, y1 * GRID_WIDTH + margin - GRID_WIDTH,
+                           (x2 - x1 + 2) * GRID_WIDTH, (y2 - y1 + 2) * GRID_WIDTH)
+        self.baked.set_clip(clip)
+        self.baked.fill((0, 0, 0, 0))
+
+        x1, y1 = max(0, x1 - 1), max(0, y1 - 1)
+        x2, y2 = min(TM_CHUNK_SIZE - 1, x2 + 1), min(TM_CHUNK_SIZE - 1, y2 + 1)
+        kinds = self.kinds[x1:x2 + 1, y1:y2 + 1]
+        shown = np.argwhere((kinds != TILE_NONE) & self.visible[x1:x2 + 1, y1:y2 + 1])
+        shown += (x1, y1)
+        order = self.place_order[shown[:, 0], shown[:, 1]].argsort(kind='stable')
+        blit_list = []
+        for x, y in shown[order].tolist():
+            surface = tile_surface(self.variants[x, y])
+            # Same spot a sprite centered on the tile would be drawn at
+            w, h = surface.get_size()
+            blit_list.append((surface, (x * GRID_WIDTH - w//2 + margin, y * GRID_WIDTH - h//2 + margin)))
+        self.baked.blits(blit_list, False)
+        self.baked.set_clip(None)
+        return clip
+
+    # Returns the area of the surface that got redrawn if part of the chunk changed
     def render(self, camera, surface):
-        self.sprite_container.set_offset(camera)
-        self.sprite_container.draw(surface)
+        rebaked = None
+        if self.baked is None:
+            self.bake()
+        elif self.dirty_area is not None:
+            rebaked = self.bake_area(*self.dirty_area)
+            self.dirty_area = None
 
+        # Only the part of the chunk that's on screen
+        shift_x = camera.x + self.x_origin + TILE_BAKE_MARGIN
+        shift_y = camera.y + self.y_origin + TILE_BAKE_MARGIN
+        if rebaked:
+            rebaked = rebaked.move(-shift_x, -shift_y)
+        view = surface.get_clip()
+        area = view.move(shift_x, shift_y).clip(self.baked.get_rect())
+        if area.width > 0 and area.height > 0:
+            surface.blit(self.baked, (area.x - shift_x, area.y - shift_y), area)
+        return rebaked
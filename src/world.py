@@ -4,10 +4,10 @@ from constants import *
 
 import math
 import collections
-import heapq
-import time
 
-from sprite import BasicSprite
+import numpy as np
+
+from sprite import BasicSprite, image_cache_stats
 from offset import OffsetGroup
 from entity import Entity
 from tilemap import TileMap
@@ -15,11 +15,29 @@ from sprite import BasicSprite
 from inventory import Item, Inventory, item_from_pickup
 from inventory_menu import InventoryMenu
 from input_manager import InputManager
+from spatial import SpatialHash
+from entity_store import EntityStore
+from scheduler import TurnScheduler
 
-from generation import generate_chunk, generate_floor
+from generation import generate_floor
+from pregen import ChunkPregenerator
+from floor_cache import cached_floor
+from portals import PortalGraph
+from reveal import RevealEngine
+from pathfinding import padded_grid, cell_index, distance_field, field_step, astar
 
 import random
 
+# Pathfinding cost added by an entity standing on a tile, see update_whole_pathfinding_map
+def entity_path_cost(entity):
+    if entity.entity_type == 'bustable':
+        return 3
+    if entity.entity_type == 'creature':
+        return 5
+    if entity.entity_type == 'door' and entity.closed:
+        return 6
+    return 0
+
 class GameWorld:
     def __init__(self, clock):
         self.clock = clock
@@ -31,25 +49,48 @@ class GameWorld:
         self.restart = False
 
         self.render_list = []
+        # Anything that moves everything on screen means the whole screen has to be presented again
+        self.render_list_changed = True
+        self.last_render_camera = None
 
         self.maps = {0: {}}
 
+        # (chunk_x, chunk_y, n) -> room info, from generation.label_rooms (see build_chunk)
+        self.rooms = {}
+
         # If this entity group fills up with too many entities (a really big floor) it may cause performance problems
         # not worrying about it for now but might make a deactivated entity group or something
-        self.entity_group = OffsetGroup()
+        self.entity_group = OffsetGroup(grid_size=SPRITE_GRID_SIZE)
+        # Core fields of every entity on the floor, see entity_store.py
+        self.entity_store = EntityStore()
+        # Which entities take turns or animate
+        self.scheduler = TurnScheduler(self)
+        # grid position -> entities, kept current by the entities themselves so what_is_at is a lookup
+        self.entity_index = SpatialHash()
         offset_x, offset_y = get_screen_center_offset()
         self.entity_group.set_camera_offset(offset_x, offset_y)
 
         self.ui_group = OffsetGroup()
 
         self.cur_half_chunk_coords = (0, 0)
-        self.floor_data = generate_floor()
+        self.floor_seed = GameSettings.floor_seed
+        if self.floor_seed is None:
+            self.floor_seed = random.getrandbits(32)
+        generated_chunks = {}
+        # Only worth saving a floor that's going to be asked for again, a random seed never is
+        if GameSettings.floor_cache and GameSettings.floor_seed is not None:
+            self.floor_data, generated_chunks = cached_floor(self.floor_seed)
+        else:
+            self.floor_data = generate_floor(self.floor_seed)
         self.starting_chunk = self.floor_data['starting-chunk']
+        self.portal_graph = PortalGraph(self, self.floor_data)
+        # Works out the rest of the chunks in the background
+        self.chunk_pregen = ChunkPregenerator(self.floor_data, self.starting_chunk, generated_chunks)
         if GameSettings.debug_mode:
             for chunk in self.floor_data['chunks']:
-                generate_chunk(self, self.floor_data, self.floor_data['chunk-properties'][chunk])
+                self.build_chunk(self.chunk_pregen.finish(chunk))
         else:
-            generate_chunk(self, self.floor_data, self.floor_data['chunk-properties'][self.starting_chunk])
+            self.build_chunk(self.chunk_pregen.finish(self.starting_chunk))
 
         chunk_spawn_x, chunk_spawn_y = self.floor_data['spawn']
         start_x, start_y = self.chunk_coord_to_world_coord(self.floor_data['starting-chunk'], chunk_spawn_x, chunk_spawn_y)
@@ -78,10 +119,20 @@ class GameWorld:
         self.current_anim_time = 0
         self.max_qued_moves = 2
 
-        self.pathfinding_map = []
+        # Toroidal storage, world (x, y) lives at [x % PATHFINDING_WIDTH, y % PATHFINDING_HEIGHT]
+        # so recentering only has to fill in the rows and columns that scroll into view
+        self.pathfinding_map = np.full((PATHFINDING_WIDTH, PATHFINDING_HEIGHT), 10, dtype=np.int8)
         self.pf_offset_x = 0
         self.pf_offset_y = 0
 
+        # Bumped whenever any pathfinding cell changes so the padded grid knows when to rebuild
+        self.pf_version = 0
+        self.pf_grid_key = None
+        self.pf_grid = None
+
+        # strength -> distance field toward the player, built lazily and thrown away every turn
+        self.flow_fields = {}
+
         self.cam_shake_intensity = 4
         self.cam_shake_countdown = 0
 
@@ -112,6 +163,7 @@ class GameWorld:
 
         # Reveal the room where the player starts
         self.update_whole_pathfinding_map()
+        self.revealer = RevealEngine(self)
         self.revealing = False
         self.revealing = self.reveal(start_x, start_y)
 
@@ -135,12 +187,7 @@ class GameWorld:
             return False
 
         if self.revealing:
-            try:
-                frames = math.ceil(self.clock.get_time() / (100/6))
-                for i in range(frames):
-                    next(self.revealing)
-            except StopIteration as s:
-                self.revealing = False
+            self.revealing = self.revealer.step(GameSettings.reveal_frame_budget / 1000)
 
         for event in all_events:
             if event.type == KEYDOWN:
@@ -155,20 +202,19 @@ class GameWorld:
 
             anim_progress = self.current_anim_time / self.animation_length
             anim_progress = min(1.0, anim_progress)
-            for entity in self.entity_group.sprites():
-                if entity.animates and entity.active:
-                    entity.animate_update(anim_progress)
+            for entity in self.scheduler.animated():
+                entity.animate_update(anim_progress)
 
             if anim_progress == 1.0:
                 self.animating = False 
                 self.current_anim_time = 0
-                for entity in self.entity_group.sprites():
+                for entity in self.scheduler.with_effects():
                     entity.post_turn()
-                    if self.player == entity and entity.just_moved:
-                        self.after_player_move()
+                if self.player.just_moved and self.player.living:
+                    self.after_player_move()
 
-                    if entity.animates and entity.active:
-                        entity.reset_turn_anim()
+                for entity in self.scheduler.animated():
+                    entity.reset_turn_anim()
 
         if not self.animating and len(self.move_que) > 0:
             self.handle_move_que()
@@ -177,6 +223,14 @@ class GameWorld:
 
         return True
 
+    # Nothing is going to change until there's some input
+    def is_idle(self):
+        if self.animating or self.revealing or len(self.move_que) > 0:
+            return False
+        if self.cam_shake_countdown > 0 or self.exit_next or self.reset_next:
+            return False
+        return not self.input_manager.any_key_down()
+
     def delta_time_seconds(self):
         return self.clock.get_time() / 1000
     
@@ -191,14 +245,19 @@ class GameWorld:
             self.health_blips[i].visible = True if hp > i else False
 
     def time_advance(self):
-        for e in self.entity_group.sprites():
-            # Call even if not active so they can wake themselves up
-            if e.moves and not e.hidden:
-                e.do_a_thing()
+        self.flow_fields = {}
+        self.scheduler.take_turn()
 
     def get_player(self):
         return self.player
 
+    # Performance counters, printed when the game exits in debug mode
+    def print_stats(self):
+        print('floor seed', self.floor_seed)
+        print(self.portal_graph.stats())
+        print(self.revealer.stats())
+        print(image_cache_stats())
+
     def handle_move_que(self):
         if not self.player.living:
             return
@@ -250,16 +309,20 @@ class GameWorld:
             e.take_damage(entity.get_attack())
 
             # update the pathfinding at the target in case it died
-            self.update_pathfinding_node(ex + xdelta, ey + ydelta)
+            # creatures far enough away to go the long way can be fighting outside the window
+            if self.in_pathfinding_window(ex + xdelta, ey + ydelta):
+                self.update_pathfinding_node(ex + xdelta, ey + ydelta)
             entity.bump_animation(xdelta, ydelta)
             return False
         
         # Now actually move if we didn't bump something
         entity.relative_move(xdelta, ydelta)
 
-        # Update the pathfinding map for the node we moved from and moved to
-        self.update_pathfinding_node(ex, ey)
-        self.update_pathfinding_node(ex + xdelta, ey + ydelta)
+        # Update the pathfinding map for the node we moved from and moved to, if they're in the window
+        if self.in_pathfinding_window(ex, ey):
+            self.update_pathfinding_node(ex, ey)
+        if self.in_pathfinding_window(ex + xdelta, ey + ydelta):
+            self.update_pathfinding_node(ex + xdelta, ey + ydelta)
 
     def after_player_move(self):
         px, py = self.player.get_grid_x_y()
@@ -268,15 +331,16 @@ class GameWorld:
         if self.get_p_half_chunk_coords() != self.cur_half_chunk_coords:
             self.cur_half_chunk_coords = self.get_p_half_chunk_coords()
             self.update_render_list()
+            _, _, chunk_x, chunk_y = self.translate_chunk_coords(px, py)
+            self.chunk_pregen.prioritize((chunk_x, chunk_y))
 
         for e in stuff_here['entities']:
             if e.entity_type == 'door':
+                if e.closed:
+                    self.portal_graph.invalidate_at(px, py)
                 e.closed = False
                 e.visible = False
-                if self.revealing:
-                    print("Trying to reveal while one reveal is still active!")
-                else:
-                    self.revealing = self.reveal(px, py)
+                self.revealing = self.reveal(px, py)
             elif e.entity_type == 'pickup':
                 pickup_item = item_from_pickup(e)
                 if pickup_item:
@@ -286,21 +350,30 @@ class GameWorld:
         path_center_x = (PATHFINDING_WIDTH//2) - self.pf_offset_x
         path_center_y = (PATHFINDING_HEIGHT//2) - self.pf_offset_y
         if max(abs(px - path_center_x), abs(py - path_center_y)) > PATHFINDING_CENTER_DEADZONE:
-            self.update_whole_pathfinding_map()
+            self.scroll_pathfinding_map()
 
     def what_is_at(self, x, y):
         # Return tile info and whatever entities are at a tile position
         in_chunk_x, in_chunk_y, chunk_x, chunk_y = self.translate_chunk_coords(x, y)
         ret = {'tile': self.get_tile_from_world_coord(x, y)}
+        ret['entities'] = self.entity_index.at(x, y)
+
+        if GameSettings.check_entity_index:
+            self.check_entity_index_at(x, y, ret['entities'])
+        return ret
 
-        entities_here = []
+    # Compare the index against the old linear scan of the whole entity group
+    def check_entity_index_at(self, x, y, indexed):
+        scanned = []
         for e in self.entity_group.sprites():
             ex, ey = e.get_grid_x_y()
             if ex == x and ey == y:
-                entities_here.append(e)
+                scanned.append(e)
 
-        ret['entities']= entities_here
-        return ret
+        if set(scanned) != set(indexed):
+            print("Entity index mismatch at " + str((x, y)))
+            print("  index: " + str([e.subtype for e in indexed]))
+            print("  scan:  " + str([e.subtype for e in scanned]))
 
     ####################################################
     #Pathfinding
@@ -315,43 +388,70 @@ class GameWorld:
         self.pf_offset_x = -(path_center_x - (PATHFINDING_WIDTH//2))
         self.pf_offset_y = -(path_center_y - (PATHFINDING_HEIGHT//2))
 
-        count_nodes = 0
-        hidden_tiles = 0
-        total = PATHFINDING_WIDTH * PATHFINDING_HEIGHT
-        skipped = 0
+        self.write_pathfinding_region(-self.pf_offset_x, -self.pf_offset_y, PATHFINDING_WIDTH, PATHFINDING_HEIGHT)
+
+    # Recenter on the player, only computing the rows and columns that scrolled into the window
+    def scroll_pathfinding_map(self):
+        old_left, old_top = -self.pf_offset_x, -self.pf_offset_y
+        path_center_x, path_center_y = self.player.get_grid_x_y()
+        new_left = path_center_x - (PATHFINDING_WIDTH//2)
+        new_top = path_center_y - (PATHFINDING_HEIGHT//2)
+        shift_x, shift_y = new_left - old_left, new_top - old_top
+
+        if abs(shift_x) >= PATHFINDING_WIDTH or abs(shift_y) >= PATHFINDING_HEIGHT:
+            self.update_whole_pathfinding_map()
+            return
+
+        self.pf_offset_x = -new_left
+        self.pf_offset_y = -new_top
+
+        if shift_x > 0:
+            self.write_pathfinding_region(old_left + PATHFINDING_WIDTH, new_top, shift_x, PATHFINDING_HEIGHT)
+        elif shift_x < 0:
+            self.write_pathfinding_region(new_left, new_top, -shift_x, PATHFINDING_HEIGHT)
+
+        if shift_y > 0:
+            self.write_pathfinding_region(new_left, old_top + PATHFINDING_HEIGHT, PATHFINDING_WIDTH, shift_y)
+        elif shift_y < 0:
+            self.write_pathfinding_region(new_left, new_top, PATHFINDING_WIDTH, -shift_y)
+
+    # Compute a rectangle of the world and copy it into the toroidal storage
+    def write_pathfinding_region(self, world_x, world_y, w, h):
+        region = self.compute_pathfinding_region(world_x, world_y, w, h)
+        ring_x = np.arange(world_x, world_x + w) % PATHFINDING_WIDTH
+        ring_y = np.arange(world_y, world_y + h) % PATHFINDING_HEIGHT
+        self.pathfinding_map[np.ix_(ring_x, ring_y)] = region
+        self.pf_version += 1
+
+    # The current window unrolled so it's indexed by pathfinding coordinates [pf_x, pf_y]
+    def pathfinding_window(self):
+        return np.roll(self.pathfinding_map, (self.pf_offset_x, self.pf_offset_y), axis=(0, 1))
+
+    # Build the pathfinding costs for a rectangle of the world, indexed [x, y] from its top left
+    # tiles come straight from each chunk's path_costs array, then entities are stamped on top
+    def compute_pathfinding_region(self, world_x, world_y, w, h):
         # 10 is a wall or outside the loaded chunks
-        self.pathfinding_map = []
-        for pf_x in range(PATHFINDING_WIDTH):
-            self.pathfinding_map.append([0] * PATHFINDING_HEIGHT)
-            for pf_y in range(PATHFINDING_HEIGHT):
-                world_x, world_y = (pf_x - self.pf_offset_x, pf_y - self.pf_offset_y)
-                if not self.chunk_exists_at(world_x, world_y):
-                    skipped += 1
-                    self.pathfinding_map[pf_x][pf_y] = 10
-                    continue
+        region = np.full((w, h), 10, dtype=np.int8)
 
-                tile = self.get_tile_from_world_coord(world_x, world_y)
-                if not tile or not tile.visible:
-                    if tile:
-                        hidden_tiles += 1
-                    self.pathfinding_map[pf_x][pf_y] = 10
+        first_cx, first_cy = world_x // TM_CHUNK_SIZE, world_y // TM_CHUNK_SIZE
+        last_cx, last_cy = (world_x + w - 1) // TM_CHUNK_SIZE, (world_y + h - 1) // TM_CHUNK_SIZE
+        for chunk_y in range(first_cy, last_cy + 1):
+            for chunk_x in range(first_cx, last_cx + 1):
+                if not self.chunk_exists(chunk_x, chunk_y):
                     continue
+                origin_x, origin_y = chunk_x * TM_CHUNK_SIZE, chunk_y * TM_CHUNK_SIZE
+                x1, x2 = max(world_x, origin_x), min(world_x + w, origin_x + TM_CHUNK_SIZE)
+                y1, y2 = max(world_y, origin_y), min(world_y + h, origin_y + TM_CHUNK_SIZE)
+                chunk_costs = self.maps[chunk_y][chunk_x].path_costs
+                region[x1 - world_x:x2 - world_x, y1 - world_y:y2 - world_y] = chunk_costs[x1 - origin_x:x2 - origin_x, y1 - origin_y:y2 - origin_y]
 
-                stuff = self.what_is_at(world_x, world_y)
-                for entity in stuff['entities']:
-                    if entity.entity_type == 'bustable':
-                        self.pathfinding_map[pf_x][pf_y] = max(3, self.pathfinding_map[pf_x][pf_y])
-                    if entity.entity_type == 'creature':
-                        self.pathfinding_map[pf_x][pf_y] = max(5, self.pathfinding_map[pf_x][pf_y])
-                    if entity.entity_type == 'door' and entity.closed:
-                        self.pathfinding_map[pf_x][pf_y] = max(6, self.pathfinding_map[pf_x][pf_y])
-
-                if self.pathfinding_map[pf_x][pf_y] == 0:
-                    count_nodes += 1
+        for entity in self.entity_index.query_rect(world_x, world_y, world_x + w - 1, world_y + h - 1):
+            cost = entity_path_cost(entity)
+            rx, ry = entity.grid_x - world_x, entity.grid_y - world_y
+            if cost > region[rx, ry]:
+                region[rx, ry] = cost
 
-        #print("Updated pathfinding map, " + str(count_nodes) + " traversable nodes")
-        #print("Also " + str(hidden_tiles) + " hidden spaces")
-        #print("And " + str(skipped) + " skipped out of " + str(total) + ", " + str(total - skipped) + " checked")
+        return region
 
     # Dont call with coordinates in an unloaded chunk
     # Coordinates in world space unless pf_coords is true
@@ -370,22 +470,21 @@ class GameWorld:
             return
 
         if not stuff:
-            tile = self.get_tile_from_world_coord(world_x, world_y)
-            if not tile or not tile.visible:
-                self.pathfinding_map[pf_x][pf_y] = 10
-                return
-
-            self.pathfinding_map[pf_x][pf_y] = 0
-
             stuff = self.what_is_at(world_x, world_y)
 
+        tile = stuff['tile']
+        cost = 0 if tile and tile.visible else 10
         for entity in stuff['entities']:
-            if entity.entity_type == 'bustable':
-                self.pathfinding_map[pf_x][pf_y] = max(3, self.pathfinding_map[pf_x][pf_y])
-            if entity.entity_type == 'creature':
-                self.pathfinding_map[pf_x][pf_y] = max(5, self.pathfinding_map[pf_x][pf_y])
+            cost = max(cost, entity_path_cost(entity))
+
+        ring_x, ring_y = world_x % PATHFINDING_WIDTH, world_y % PATHFINDING_HEIGHT
+        if self.pathfinding_map[ring_x, ring_y] != cost:
+            self.pathfinding_map[ring_x, ring_y] = cost
+            self.pf_version += 1
 
     # Find path
+    # Nothing in the game searches with this right now, chasers share a flow field (flow_step_toward_player)
+    # and far away ones go through the portal graph, it's here for one-off searches and bench/bench_pathfinding.py
     # if abs_path == True, return list of world coordinates along the path
     # otherwise return list of x, y deltas to follow path
     def pathfind(self, start_x, start_y, dest_x, dest_y, strength=0, abs_path=False):
@@ -399,95 +498,75 @@ class GameWorld:
             print("Tried to pathfind from outside pathfinding space")
             print((start_x, start_y), start)
             return []
-        
-
-        dest_x, dest_y = (dest_x + self.pf_offset_x, dest_y + self.pf_offset_y)
-        dest = (dest_x, dest_y)
-
-        def heuristic(coord):
-            x, y = coord
-            return math.sqrt(pow(x - dest_x, 2) + pow(y - dest_y, 2))
-
-        adjacent_deltas = []
-        for dx in [-1, 0, 1]:
-            for dy in [-1, 0, 1]:
-                if dx == 0 and dy == 0:
-                    continue
-                adjacent_deltas.append((dx, dy))
-
-        def delta_add(delta, coord):
-            return (delta[0] + coord[0], delta[1] + coord[1])
-
-        def is_diagonal(delta):
-            return delta[0] != 0 and delta[1] != 0
 
-        def straights(delta):
-            return [(delta[0], 0), (0, delta[1])]
-        
-        path_found = False
-
-        delta_from = {start: None}
-        position_from = {start: None}
-        node_cost = {start: 0}
-        # priority que items go in the list as: (priority, (x, y))
-        frontier = [(0, start)]
-        while len(frontier) > 0:
-            _, cur = heapq.heappop(frontier)
-
-            if cur == dest:
-                path_found = True
-                break
-
-            # Always cost 1 to move for now
-            old_cost = node_cost[cur]
-            next_cost = old_cost + 1
-            for delta in adjacent_deltas:
-                adj = delta_add(delta, cur)
-                if outside_check(adj):
-                    continue
-                val = self.pathfinding_map[adj[0]][adj[1]]
-                # If the node is the destination, ignore strength (attack player)
-                if val > strength and adj != dest:
-                    continue
-                # I'm doing diagonal movement for nice pathing but it needs to be a valid path orthoganally too
-                if is_diagonal(delta):
-                    available_straights = 2
-                    for s_delta in straights(delta):
-                        s_val = self.pathfinding_map[cur[0] + s_delta[0]][cur[1] + s_delta[1]]
-                        if s_val > strength:
-                            available_straights -= 1
-                    if available_straights < 1:
-                        continue
-
-
-                if adj in node_cost and node_cost[adj] <= next_cost:
-                    continue
-                node_cost[adj] = next_cost
-                priority = next_cost + heuristic(adj)
-                heapq.heappush(frontier, (priority, adj))
-                delta_from[adj] = delta
-                position_from[adj] = cur
-
-        if not path_found:
-            #print("Could not find path, " + str(len(node_cost)) + " nodes checked")
+        dest = (dest_x + self.pf_offset_x, dest_y + self.pf_offset_y)
+        if outside_check(dest):
             return False
 
-        def to_world(coord):
-            lx, ly = coord
-            return (lx - self.pf_offset_x, ly - self.pf_offset_y)
+        grid, stride = self.padded_pathfinding_grid()
+        start_cell = cell_index(stride, start[0], start[1])
+        cells = astar(grid, stride, start_cell, cell_index(stride, dest[0], dest[1]), strength)
+        if not cells:
+            #print("Could not find path")
+            return False
 
         path = []
-        cur_node = dest
-        while cur_node != start:
+        prev_x, prev_y = start_x, start_y
+        for cell in cells:
+            pad_x, pad_y = divmod(cell, stride)
+            world_x, world_y = (pad_x - 1 - self.pf_offset_x, pad_y - 1 - self.pf_offset_y)
             if abs_path:
-                path.append(to_world(cur_node))
+                path.append((world_x, world_y))
             else:
-                path.append(delta_from[cur_node])
-            cur_node = position_from[cur_node]
-
-        path.reverse()
+                path.append((world_x - prev_x, world_y - prev_y))
+            prev_x, prev_y = world_x, world_y
         return path
 
+    # Flat wall-padded copy of the pathfinding window (see pathfinding.py), rebuilt only when the map changed
+    def padded_pathfinding_grid(self):
+        key = (self.pf_version, self.pf_offset_x, self.pf_offset_y)
+        if self.pf_grid_key != key:
+            self.pf_grid = padded_grid(self.pathfinding_window())
+            self.pf_grid_key = key
+        return self.pf_grid
+
+    def in_pathfinding_window(self, x, y):
+        pf_x, pf_y = (x + self.pf_offset_x, y + self.pf_offset_y)
+        return min(pf_x, pf_y) >= 0 and pf_x < PATHFINDING_WIDTH and pf_y < PATHFINDING_HEIGHT
+
+    # Path across the whole floor through the inter-chunk doors, for when the pathfinding window doesn't cover it
+    # Only the part of the path up to the first door (or the destination if it's in the same chunk) is returned
+    # if abs_path == True, return list of world coordinates along that part, otherwise list of x, y deltas
+    def long_range_pathfind(self, start_x, start_y, dest_x, dest_y, abs_path=False):
+        route = self.portal_graph.find_route((start_x, start_y), (dest_x, dest_y))
+        if not route:
+            return False
+        _, segment = route
+        if abs_path:
+            return segment
+
+        deltas = []
+        prev_x, prev_y = start_x, start_y
+        for x, y in segment:
+            deltas.append((x - prev_x, y - prev_y))
+            prev_x, prev_y = x, y
+        return deltas
+
+    # Next step (dx, dy) toward the player for a creature at a world position, or False if there's no path
+    # Every chaser this turn shares one breadth first search per strength instead of running A* each
+    def flow_step_toward_player(self, x, y, strength=0):
+        pf_x, pf_y = (x + self.pf_offset_x, y + self.pf_offset_y)
+        if min(pf_x, pf_y) < 0 or pf_x > PATHFINDING_WIDTH - 1 or pf_y > PATHFINDING_HEIGHT - 1:
+            return False
+
+        if strength not in self.flow_fields:
+            grid, stride = self.padded_pathfinding_grid()
+            player_x, player_y = self.player.get_grid_x_y()
+            root = cell_index(stride, player_x + self.pf_offset_x, player_y + self.pf_offset_y)
+            self.flow_fields[strength] = (grid, stride, distance_field(grid, stride, root, strength))
+
+        grid, stride, dist = self.flow_fields[strength]
+        return field_step(grid, stride, dist, cell_index(stride, pf_x, pf_y), strength)
 
     # Pathfinding
     ####################################################
@@ -495,88 +574,82 @@ class GameWorld:
     
     # reveal a tile and all connected hidden tiles including entities on them
     # stop spreading the reveal if you hit a door or a non hidden tile
+    # Rooms worked out during generation are revealed all at once, anything else falls back to
+    # a flood fill that happens a bit at a time in update(), see reveal.py
+    # returns True if there's still revealing left to do
     def reveal(self, x, y):
+        room_ids = self.rooms_around(x, y)
+        if room_ids is False:
+            self.revealer.start(x, y)
+        else:
+            self.revealer.reveal_rooms(x, y, room_ids)
+        return self.revealer.active()
 
-        iterations = 0
-        iterations_per = 2
-
-        to_check = set([(x, y)])
-        checked = set([])
-
-        adjacents = [(-1, 0), (0, -1), (1, 0), (0, 1)]
-
-        start_time = time.time()
-        total_runtime = 0
-        self_time = 0
-
-        infinity_protection = 200
-        while len(to_check) > 0:
-            for px, py in to_check.copy():
-                # Show everything here
-                stuff_here = self.what_is_at(px, py)
-                stuff_here['tile'].visible = True
-
-                stop_here = False
-                for e in stuff_here['entities']:
-                    e.reveal()
-                    # If there's a closed door stop checking adjacent tiles
-                    if e.entity_type == 'door':
-                        if e.closed:
-                            #print('Hit closed door')
-                            stop_here = True
-                        else:
-                            e.visible = False
-
-                checked.add((px, py))
-                self.update_pathfinding_node(px, py, stuff=stuff_here)
-
-                if not stop_here:
-                    # Check all adjecent tiles for hidden tiles to show
-                    for dx, dy in adjacents:
-                        nx, ny = (px + dx, py + dy)
-                        # Skip already checked tiles or ones already in the to-check list
-                        if (nx, ny) in checked or (nx, ny) in to_check:
-                            continue
-
-                        is_new_chunk = self.pending_chunk_exists_at(nx, ny)
-                        if is_new_chunk:
-                            #print('revealing new chunk')
-                            _, _, chunk_x, chunk_y = self.translate_chunk_coords(nx, ny)
-                            generate_chunk(self, self.floor_data, self.floor_data['chunk-properties'][(chunk_x, chunk_y)])
-
-                        stuff = self.what_is_at(nx, ny)
-
-                        if not stuff['tile'] or stuff['tile'].visible:
-                            continue
-
-                        # Ok so this is a hidden tile, add it to the list
-                        to_check.add((nx, ny))
-
-                to_check.remove((px, py))
-
-                iterations += 1
-                if iterations % iterations_per == 0:
-                    self_time += time.time() - start_time
-                    #self.update_whole_pathfinding_map()
-                    total_runtime += time.time() - start_time
-                    yield 1
-                    start_time = time.time()
-
-            infinity_protection -= 1
-            if infinity_protection < 0:
-                print("Infinite loop in world.reveal()!")
-                return
-            # End while
-
-        self_time += time.time() - start_time
-
-        # More tiles available for movement
-        self.update_whole_pathfinding_map()
+    # Room id at a world position or None for walls, door tiles and unloaded chunks
+    def room_at(self, x, y):
+        in_chunk_x, in_chunk_y, chunk_x, chunk_y = self.translate_chunk_coords(x, y)
+        if not self.chunk_exists(chunk_x, chunk_y):
+            return None
+        room_number = self.maps[chunk_y][chunk_x].room_ids[in_chunk_x, in_chunk_y]
+        if room_number == -1:
+            return None
+        return (chunk_x, chunk_y, int(room_number))
+
+    # The room a position is in, or the rooms on either side if it's a door tile
+    # False if there isn't any room info to go on, including when the chunk on the other side isn't generated yet
+    def rooms_around(self, x, y):
+        room_id = self.room_at(x, y)
+        if room_id:
+            return [room_id]
+        if not self.get_tile_from_world_coord(x, y):
+            return False
 
-        # total time logging
-        total_runtime += time.time() - start_time
-        #print("reveal runtime (over multiple frames) self: " + str(round(self_time/1000, 7)) + " total: " + str(round(total_runtime/1000, 7)))
-                
+        room_ids = []
+        for dx, dy in RevealEngine.ADJACENTS:
+            if self.pending_chunk_exists_at(x + dx, y + dy):
+                if not self.generate_chunk_at(x + dx, y + dy):
+                    return False
+            room_id = self.room_at(x + dx, y + dy)
+            if room_id and room_id not in room_ids:
+                room_ids.append(room_id)
+        if len(room_ids) == 0:
+            return False
+        return room_ids
+
+    # Build the pending chunk at a world position if it's been generated, returns False if it isn't ready yet
+    def generate_chunk_at(self, x, y):
+        _, _, chunk_x, chunk_y = self.translate_chunk_coords(x, y)
+        chunk = self.chunk_pregen.take((chunk_x, chunk_y))
+        if chunk is None:
+            return False
+        self.build_chunk(chunk)
+        return True
+
+    # Make the TileMap and entities for a chunk that generation.generate_chunk worked out
+    def build_chunk(self, chunk):
+        chunk_pos = chunk['position']
+        chunk_x, chunk_y = chunk_pos
+        visible = GameSettings.debug_mode
+
+        tile_map = TileMap(chunk_x, chunk_y)
+        tile_map.load_grid(chunk['grid'], visible)
+        self.add_chunk(chunk_x, chunk_y, tile_map)
+
+        for spawn in chunk['spawns']:
+            spawn_x, spawn_y = spawn['position']
+            world_x, world_y = self.chunk_coord_to_world_coord(chunk_pos, spawn_x, spawn_y)
+            self.add_entity_at(world_x, world_y, visible, spawn['entity_type'], spawn['subtype'])
+
+        for n, room in enumerate(chunk['rooms']):
+            entities = []
+            for world_x, world_y in room['tiles']:
+                entities.extend(self.what_is_at(world_x, world_y)['entities'])
+            self.rooms[(chunk_x, chunk_y, n)] = {
+                'tiles': room['tiles'],
+                'entities': entities,
+                'doors': room['doors'],
+                'revealed': False,
+            }
 
     def get_tile_from_world_coord(self, x, y):
         in_chunk_x, in_chunk_y, chunk_x, chunk_y = self.translate_chunk_coords(x, y)
@@ -585,6 +658,11 @@ class GameWorld:
         else:
             return False
 
+    def set_tile_visible(self, x, y, visible=True):
+        in_chunk_x, in_chunk_y, chunk_x, chunk_y = self.translate_chunk_coords(x, y)
+        if self.chunk_exists(chunk_x, chunk_y):
+            self.maps[chunk_y][chunk_x].set_tile_visible(in_chunk_x, in_chunk_y, visible)
+
     def chunk_exists(self, chunk_x, chunk_y):
         if chunk_y not in self.maps or chunk_x not in self.maps[chunk_y]:
             return False
@@ -618,6 +696,7 @@ class GameWorld:
         return (in_chunk_x + (chunk_x * TM_CHUNK_SIZE), in_chunk_y + (chunk_y * TM_CHUNK_SIZE))
 
     def update_render_list(self):
+        old_render_list = self.render_list
         self.render_list = []
         render_x = math.ceil(self.cur_half_chunk_coords[0]/2)
         render_y = math.ceil(self.cur_half_chunk_coords[1]/2)
@@ -630,6 +709,12 @@ class GameWorld:
                 t_map = self.maps[row][col]
                 self.render_list.append(t_map)
 
+        # Chunks that went out of view don't need to keep their baked surfaces around
+        for t_map in old_render_list:
+            if t_map not in self.render_list:
+                t_map.release_bake()
+        self.render_list_changed = True
+
     def do_camera_shake(self, length, intensity=4):
         self.cam_shake_intensity = intensity
         self.cam_shake_countdown = length
@@ -642,20 +727,33 @@ class GameWorld:
         new_cam.y += random.randint(0, (self.cam_shake_intensity * 2)) - self.cam_shake_intensity
         return new_cam
 
+    # Returns the areas of the surface that changed since the last render, or None if all of it might have
     def render(self, camera, surface):
         camera = self.shake_this_camera(camera)
+        ui_camera = self.shake_this_camera(pygame.Rect(0, 0, 10, 10))
+        whole_screen = self.render_list_changed or self.last_render_camera != (camera.topleft, ui_camera.topleft)
+        self.render_list_changed = False
+        self.last_render_camera = (camera.topleft, ui_camera.topleft)
+
+        dirty = []
         for t_map in self.render_list:
-            t_map.render(camera, surface)
+            rebaked = t_map.render(camera, surface)
+            if rebaked:
+                dirty.append(rebaked)
 
-        self.entity_group.render(camera, surface)
+        dirty.extend(self.entity_group.render(camera, surface))
+        dirty.extend(self.ui_group.render(ui_camera, surface))
 
-        ui_camera = self.shake_this_camera(pygame.Rect(0, 0, 10, 10))
-        self.ui_group.render(ui_camera, surface)
+        if whole_screen:
+            return None
+        return dirty
 
     def add_chunk(self, chunk_x, chunk_y, chunk):
         if chunk_y not in self.maps:
             self.maps[chunk_y] = {}
         self.maps[chunk_y][chunk_x] = chunk
+        for dx, dy in [(0, 0), (1, 0), (0, 1), (-1, 0), (0, -1)]:
+            self.portal_graph.invalidate_chunk((chunk_x + dx, chunk_y + dy))
         self.update_render_list()
 
     def add_entity_at(self, x, y, visible, entity_type, entity_subtype):
@@ -671,3 +769,14 @@ class GameWorld:
                 e.die(False)
 
             self.entity_group.remove(e)
+            self.entity_index.remove(e)
+
+    # Entities call these to keep entity_index current
+    def entity_placed(self, entity):
+        self.entity_index.add(entity, entity.grid_x, entity.grid_y)
+        self.scheduler.entity_moved(entity)
+
+    def entity_removed(self, entity):
+        self.entity_index.remove(entity)
+        if entity.entity_type in ('bustable', 'door'):
+            self.portal_graph.invalidate_at(entity.grid_x, entity.grid_y)
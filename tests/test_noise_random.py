@@ -0,0 +1,48 @@
+# The numpy squirrel3 in noise_random.py has to give exactly the same numbers as the scalar one,
+# floors generated from a seed depend on it
+# run from the repository root: python -m pytest tests
+import os
+import sys
+import itertools
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import numpy as np
+
+from constants import *
+from noise_random import *
+
+SEEDS = [0, 1, 7, 0x7fffffff, 0x80000000, MASK_32]
+# Small, negative and way past 32 bit positions, the big ones are where only reducing at the end went wrong
+POSITIONS = [0, 1, 2, 255, 256, 65535, 65536, MASK_32 - 1, MASK_32, BIT_32, BIT_32 + 1, 2**40 + 12345, 2**63 - 1,
+             -1, -2, -256, -65536, -(2**31), -(2**40)]
+CORNERS = [(0, 0), (-3, -5), (TM_CHUNK_SIZE * 7, -TM_CHUNK_SIZE * 11), (2**20, 2**20)]
+
+def test_batch_matches_scalar():
+    for seed in SEEDS:
+        batch = squirrel3_batch(np.array(POSITIONS, dtype=np.int64), seed)
+        assert batch.tolist() == [squirrel3_seeded_hash(position, seed) for position in POSITIONS]
+
+        # Whole range of positions one after another
+        positions = np.arange(-5000, 5000, dtype=np.int64)
+        batch = squirrel3_batch(positions, seed)
+        assert batch.tolist() == [squirrel3_seeded_hash(position, seed) for position in positions.tolist()]
+
+def test_grid_2d_matches_scalar():
+    for seed, (x, y) in itertools.product(SEEDS, CORNERS):
+        grid = noise_grid_2d(x, y, 9, 7, seed)
+        for i, j in itertools.product(range(9), range(7)):
+            assert grid[i, j] == get_2d_seeded_noise(x + i, y + j, seed)
+
+def test_ints_in_range_matches_scalar():
+    for seed, (x, y) in itertools.product(SEEDS, CORNERS):
+        grid = noise_grid_2d(x, y, 9, 7, seed)
+        ranged = ints_in_range(grid, -3, 9)
+        for i, j in itertools.product(range(9), range(7)):
+            assert ranged[i, j] == int_in_range(int(grid[i, j]), -3, 9)
+
+def test_grid_3d_matches_scalar():
+    for seed, (x, y) in itertools.product(SEEDS, CORNERS):
+        grid = noise_grid_3d(x, y, -y, 5, 4, 3, seed)
+        for i, j, k in itertools.product(range(5), range(4), range(3)):
+            assert grid[i, j, k] == get_3d_seeded_noise(x + i, y + j, -y + k, seed)
@@ -0,0 +1,62 @@
+# Routes through the portal graph get reused between find_route calls until a chunk changes
+# run from the repository root: python -m pytest tests
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT, 'src'))
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+
+from constants import *
+
+def make_world(seed):
+    # data/ and assets/ are loaded relative to the repository root
+    os.chdir(ROOT)
+    pygame.init()
+    pygame.display.set_mode((270, 200))
+    GameSettings.floor_seed = seed
+    GameSettings.debug_mode = True
+    from world import GameWorld
+    return GameWorld(pygame.time.Clock())
+
+# A pair of open positions in different chunks with a route between them
+def far_apart_route(world):
+    graph = world.portal_graph
+    chunks = sorted(world.floor_data['chunks'])
+    for start_chunk in chunks:
+        for dest_chunk in chunks:
+            if start_chunk == dest_chunk:
+                continue
+            starts = sorted(graph.open_cells(start_chunk) - set(graph.portals))
+            dests = sorted(graph.open_cells(dest_chunk) - set(graph.portals))
+            if starts and dests and graph.find_route(starts[0], dests[0]):
+                return starts[0], dests[0]
+    return None
+
+def test_route_reused_until_chunk_changes():
+    world = make_world(7)
+    graph = world.portal_graph
+    # Every door starts closed, open them so there's somewhere to go
+    for e in world.entity_group.sprites():
+        if e.entity_type == 'door':
+            e.closed = False
+    for chunk in world.floor_data['chunks']:
+        graph.invalidate_chunk(chunk)
+    start, dest = far_apart_route(world)
+
+    route = graph.find_route(start, dest)
+    hits, misses = graph.hits, graph.misses
+    assert graph.find_route(start, dest) == route
+    assert graph.hits > hits
+    assert graph.misses == misses
+
+    _, _, chunk_x, chunk_y = world.translate_chunk_coords(start[0], start[1])
+    graph.invalidate_chunk((chunk_x, chunk_y))
+    assert graph.routes == {}
+    assert graph.find_route(start, dest) == route
+    assert graph.misses > misses
+
+    GameSettings.floor_seed = None
+    GameSettings.debug_mode = False